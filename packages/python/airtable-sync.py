@@ -9,10 +9,20 @@
 # ---- dependencies {{{
 from pathlib import Path
 from sys import stdout
+from concurrent.futures import ThreadPoolExecutor
 import argparse
+import base64
+import json
+import random
+import threading
+import time
 from loguru import logger
 import pyairtable as at
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import requests
+import yaml
 #}}}
 
 LINKS = {
@@ -20,12 +30,58 @@ LINKS = {
     'cw_hearings': 'https://airtable.com/appLCRgBv3MljqZpH/tbluVSpnXTq9WxrrA/viwQ4Jbge0vPW5mqV?blocks=hide',
 }
 
+# Airtable allows 5 requests per second per base, and asks clients to back off after a 429
+RATE = 5
+RETRIES = 6
+BACKOFF = 1
+ROWGROUP = 10000
+# incremental watermarks are set this many seconds before the sync started, so a
+# local clock running ahead of Airtable's can't skip edits (overlap is just re-fetched)
+SKEW = 300
+
+# Arrow types for Airtable field types with a fixed cell format; others
+# (formulas, lookups, attachments, ...) are inferred from their first values
+ARROW_TYPES = {
+    'singleLineText': pa.string(), 'multilineText': pa.string(), 'richText': pa.string(),
+    'email': pa.string(), 'url': pa.string(), 'phoneNumber': pa.string(), 'singleSelect': pa.string(),
+    'number': pa.float64(), 'currency': pa.float64(), 'percent': pa.float64(), 'duration': pa.float64(),
+    'rating': pa.int64(), 'autoNumber': pa.int64(), 'count': pa.int64(),
+    'checkbox': pa.bool_(),
+    'multipleSelects': pa.list_(pa.string()), 'multipleRecordLinks': pa.list_(pa.string()),
+    'date': pa.date32(),
+    'dateTime': pa.timestamp('ms', tz='UTC'), 'createdTime': pa.timestamp('ms', tz='UTC'),
+    'lastModifiedTime': pa.timestamp('ms', tz='UTC'),
+}
+
 # --- support methods --- {{{
 def getargs():
     parser = argparse.ArgumentParser()
     parser.add_argument("--hotline", default=None)
     parser.add_argument("--hearings", default=None)
+    parser.add_argument("--creds", default="creds/airtable")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only fetch records modified since the last sync and merge them into the existing parquet")
+    parser.add_argument("--state", default="output/sync-state.json")
+    parser.add_argument("--modified-field", default=None,
+                        help="last-modified field to filter on, instead of LAST_MODIFIED_TIME()")
+    parser.add_argument("--skew", type=float, default=SKEW,
+                        help="seconds of overlap between incremental syncs, to allow for clock skew")
+    parser.add_argument("--endpoint", default="https://api.airtable.com",
+                        help="API root, e.g. a local mock server for testing")
+    parser.add_argument("--rate", type=float, default=RATE,
+                        help="requests per second allowed per base")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="tables fetched at once, default is every table in LINKS")
+    parser.add_argument("--stream", action="store_true",
+                        help="write pages to parquet as they arrive instead of holding whole tables in memory")
+    parser.add_argument("--rowgroup", type=int, default=ROWGROUP,
+                        help="records per parquet row group when streaming")
+    parser.add_argument("--config", default=None,
+                        help="YAML file listing the bases/tables to sync, instead of LINKS; "
+                             "tables are streamed with cached schemas, or merged per table with --incremental")
     args = parser.parse_args()
+    if args.incremental & args.stream:
+        parser.error("--incremental merges into the existing parquet files, it can't be combined with --stream")
     return args
 
 
@@ -55,17 +111,132 @@ def processlink(url):
     return {'base_id': baseid, 'table_id': tableid}
 
 
-def getformatrows(api, baseid, tableid):
+class TokenBucket():
+    """Thread-safe token bucket: `acquire` blocks until a request is allowed."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = rate if capacity is None else capacity
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return 1
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class RateLimiter():
+    """One `TokenBucket` per base, shared by every thread fetching from that base."""
+
+    def __init__(self, rate=RATE):
+        self.rate = rate
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+
+    def acquire(self, baseid):
+        with self.lock:
+            if baseid not in self.buckets: self.buckets[baseid] = TokenBucket(rate=self.rate)
+            bucket = self.buckets[baseid]
+        return bucket.acquire()
+
+
+def requestretry(api, baseid, label, limiter=None, retries=RETRIES, **request):
+    """`api.request(**request)` against `baseid`, waiting on `limiter` first
+    and retrying 429 responses with jittered exponential backoff.
+    """
+    for attempt in range(retries + 1):
+        if limiter is not None: limiter.acquire(baseid)
+        try:
+            return api.request(**request)
+        except requests.exceptions.HTTPError as err:
+            if (err.response is None) or (err.response.status_code != 429) or (attempt == retries): raise
+            wait = BACKOFF * 2**attempt * random.uniform(1, 1.5)
+            logger.warning(f'rate limited on {label}, retrying in {wait:.1f}s')
+            time.sleep(wait)
+
+
+def requestpage(api, baseid, tableid, options, limiter=None, retries=RETRIES):
+    """One list-records request, see `requestretry`."""
+    table = api.table(baseid, tableid)
+    return requestretry(
+        api=api, baseid=baseid, label=f'{baseid}/{tableid}', limiter=limiter, retries=retries,
+        method="get", url=table.urls.records,
+        fallback=("post", table.urls.records_post), options=options)
+
+
+def fetchtablemeta(api, baseid, tableid, limiter=None):
+    """The table's entry in the metadata API (id, name, primaryFieldId, fields).
+    None if the token can't read the base schema (it needs the
+    `schema.bases:read` scope) or the table isn't in it.
+    """
+    try:
+        tables = requestretry(
+            api=api, baseid=baseid, label=f'schema of {baseid}', limiter=limiter,
+            method="get", url=api.base(baseid).urls.tables)['tables']
+    except requests.exceptions.HTTPError as err:
+        logger.warning(f'could not read the schema of {baseid}/{tableid}: {err}')
+        return None
+    table = [table for table in tables if tableid in (table['id'], table['name'])]
+    return table[0] if table else None
+
+
+def iterpages(api, baseid, tableid, limiter=None, **options):
+    """Records one page at a time, like `table.iterate()` but rate limited.
+    Pages come from an offset cursor, so within a table they are fetched
+    one after another.
+    """
+    offset = None
+    while True:
+        page = requestpage(
+            api=api, baseid=baseid, tableid=tableid, limiter=limiter,
+            options=options if offset is None else {**options, 'offset': offset})
+        yield page.get('records', [])
+        offset = page.get('offset')
+        if not offset: return
+
+
+def fetchrecords(api, baseid, tableid, limiter=None, **options):
+    """Every record in the table, and how many pages it took."""
+    records, pages = [], 0
+    for page in iterpages(api=api, baseid=baseid, tableid=tableid, limiter=limiter, **options):
+        records += page
+        pages += 1
+    return records, pages
+
+
+def getformatrows(api, baseid, tableid, limiter=None):
     if (baseid is None) | (tableid is None): return None
-    rows = api.table(baseid, tableid).all()
-    df = pd.DataFrame(rows)
+    rows, pages = fetchrecords(api=api, baseid=baseid, tableid=tableid, limiter=limiter)
+    df = pd.DataFrame(rows, columns=['id', 'createdTime', 'fields'])
     return df
 
 
-def formatfields(ref, x):
-    copy = ref.copy()
-    copy.update(x)
-    return copy
+def fetchtables(api, tableinfo, limiter, workers=None):
+    """`getformatrows` for every table at once on a thread pool, all sharing
+    `limiter`, logging each table's throughput.
+    """
+    def fetchone(label, info):
+        start = time.perf_counter()
+        df = getformatrows(api=api, baseid=info['base_id'], tableid=info['table_id'], limiter=limiter)
+        secs = time.perf_counter() - start
+        nrows = 0 if df is None else df.shape[0]
+        logger.info(f'{label}: {nrows} records in {secs:.1f}s ({nrows / max(secs, 1e-9):.0f} records/s)')
+        return df
+    if workers is None: workers = max(len(tableinfo), 1)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {label: pool.submit(fetchone, label, info) for label, info in tableinfo.items()}
+        return {label: future.result() for label, future in futures.items()}
 
 
 def formattable(table):
@@ -73,53 +244,477 @@ def formattable(table):
     Expecting data to have 1 `record_id` per row, but nrows {
     table.shape[0]} != nunique id {table.id.nunique()}"
 
-    logger.info('collecting every field reported at least once')
-    allfields = set()
-    for fieldset in table.fields.values:
-        for k in fieldset.keys(): allfields.add(k)
-    template = {field: None for field in allfields}
+    logger.info('flatten every field reported at least once into columns')
+    records = list(table.fields.values)
+    df = pd.DataFrame.from_records(records, index=range(table.shape[0]))
 
-    logger.info('use collected as template to standardize all reported data')
-    table.fields = table.fields.apply(
-        lambda x: formatfields(ref=template, x=x))
+    logger.info('standardize fields some records do not report')
+    # Airtable leaves empty fields out of a record, and those read as None in an object
+    # column of the values as reported (3 stays 3), not as NaN in a column cast to float
+    for col in df.columns[df.isna().any()]:
+        df[col] = pd.Series([record.get(col) for record in records], index=df.index, dtype=object)
 
     logger.info('format meta + report data as one table')
-    dfs = []
-    for row in table.itertuples():
-        df = pd.DataFrame([row.fields])
-        df['recordid'] = row.id
-        df['date_created'] = row.createdTime
-        dfs.append(df)
-    df = pd.concat(dfs).reset_index(drop=True)
+    df['recordid'] = table.id.values
+    df['date_created'] = table.createdTime.values
     return df
+
+
+def stringvalues(values):
+    """Cell values as text, for a field whose values don't share a type
+    (e.g. numbers and a formula's '#ERROR'): strings as they are, anything
+    else as JSON.
+    """
+    return pa.array([value if (value is None) or (type(value) is str) else json.dumps(value)
+                     for value in values], type=pa.string())
+
+
+def fieldcolumn(values):
+    try: return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError): return stringvalues(values)
+
+
+def castcolumn(column, arrowtype):
+    """`column` as `arrowtype`; a field promoted to strings takes the text of
+    values Arrow can't cast itself (lists, objects).
+    """
+    if (arrowtype != pa.string()) or (column.type == pa.string()): return column.cast(arrowtype)
+    try: return column.cast(arrowtype)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError): return stringvalues(column.to_pylist())
+
+
+def unifyfields(schemas):
+    """One schema with every field in `schemas`, in order, widening types
+    where they differ and falling back to strings where they conflict.
+    """
+    fields = {}
+    for schema in schemas:
+        for field in schema:
+            if field.name not in fields.keys(): fields[field.name] = field
+            elif field.type != fields[field.name].type:
+                try: fields[field.name] = pa.unify_schemas(
+                    [pa.schema([fields[field.name]]), pa.schema([field])], promote_options='permissive').field(0)
+                except (pa.ArrowInvalid, pa.ArrowTypeError):
+                    logger.info(f'{field.name}: {fields[field.name].type} and {field.type} values, keeping it as text')
+                    fields[field.name] = pa.field(field.name, pa.string())
+    return pa.schema(list(fields.values()))
+
+
+def flattenpage(records):
+    """One page of records as an Arrow table, with every field any of them
+    reports and the record metadata last, as `formattable` lays them out.
+    """
+    fields = list(dict.fromkeys(field for record in records for field in record['fields'].keys()))
+    columns = {field: fieldcolumn([record['fields'].get(field) for record in records]) for field in fields}
+    columns['recordid'] = pa.array([record['id'] for record in records], type=pa.string())
+    columns['date_created'] = pa.array([record['createdTime'] for record in records], type=pa.string())
+    return pa.Table.from_pydict(columns)
+
+
+def conform(table, schema):
+    """`table` with exactly the columns of `schema`, adding nulls for fields it lacks."""
+    return pa.Table.from_arrays([
+        castcolumn(table.column(field.name), field.type) if field.name in table.column_names
+        else pa.nulls(table.num_rows, type=field.type)
+        for field in schema], schema=schema)
+
+
+def metalast(schema):
+    meta = [schema.field(name) for name in ('recordid', 'date_created')]
+    return pa.schema([field for field in schema if field.name not in ('recordid', 'date_created')] + meta)
+
+
+class ParquetStream():
+    """
+    Appends record pages to a parquet file as row groups of `rowgroup` records.
+    A ParquetWriter's schema is fixed, so when a page brings a new field
+    (or widens a type, e.g. int to double) the current part file is closed
+    and a new one started with the widened schema; `close` then copies the
+    parts into `outfile` one row group at a time under the final schema.
+    A field whose types conflict (numbers, then a formula's '#ERROR') is
+    kept as text. Memory stays bounded by the row group size, not the
+    table size. `discard` removes the parts if the stream fails.
+    """
+
+    def __init__(self, outfile, rowgroup=ROWGROUP, flatten=flattenpage):
+        self.outfile = Path(outfile)
+        self.rowgroup = rowgroup
+        self.flatten = flatten
+        self.schema = None
+        self.writer = None
+        self.parts = []
+        self.buffer = []
+        self.nrows = 0
+
+
+    def __newpart__(self):
+        if self.writer is not None: self.writer.close()
+        part = self.outfile.with_name(f"{self.outfile.name}.part{len(self.parts)}")
+        self.parts.append(part)
+        self.writer = pq.ParquetWriter(part, self.schema)
+
+
+    def __flush__(self):
+        if not self.buffer: return
+        known = [] if self.schema is None else [self.schema]
+        widened = metalast(unifyfields(known + [table.schema for table in self.buffer]))
+        table = pa.concat_tables([conform(table, widened) for table in self.buffer])
+        self.buffer = []
+        if widened != self.schema:
+            self.schema = widened
+            self.__newpart__()
+        self.writer.write_table(table, row_group_size=self.rowgroup)
+
+
+    def write(self, records):
+        if not records: return 0
+        self.buffer.append(self.flatten(records))
+        self.nrows += len(records)
+        if sum(table.num_rows for table in self.buffer) >= self.rowgroup: self.__flush__()
+        return len(records)
+
+
+    def close(self):
+        self.__flush__()
+        if self.writer is None:
+            logger.warning(f'no records to write to {self.outfile}')
+            return 0
+        self.writer.close()
+        self.writer = None
+        if len(self.parts) == 1: self.parts[0].replace(self.outfile)
+        else:
+            merged = self.outfile.with_name(f"{self.outfile.name}.merge")
+            with pq.ParquetWriter(merged, self.schema) as writer:
+                for part in self.parts:
+                    source = pq.ParquetFile(part)
+                    for i in range(source.num_row_groups):
+                        writer.write_table(conform(source.read_row_group(i), self.schema))
+            merged.replace(self.outfile)
+            for part in self.parts: part.unlink()
+        self.parts = []
+        return self.nrows
+
+
+    def discard(self):
+        """Remove any part files, leaving the previous `outfile` (if any) untouched."""
+        if self.writer is not None: self.writer.close()
+        self.writer = None
+        for part in self.parts + [self.outfile.with_name(f"{self.outfile.name}.merge")]:
+            part.unlink(missing_ok=True)
+        self.parts = []
+        return 1
+
+
+def streamtable(api, info, outfile, limiter=None, rowgroup=ROWGROUP):
+    """Write every record of one table to `outfile` page by page."""
+    start = time.perf_counter()
+    stream = ParquetStream(outfile=outfile, rowgroup=rowgroup)
+    try:
+        for page in iterpages(api=api, baseid=info['base_id'], tableid=info['table_id'], limiter=limiter):
+            stream.write(page)
+        nrows = stream.close()
+    except BaseException:
+        stream.discard()
+        raise
+    secs = time.perf_counter() - start
+    logger.info(f'{outfile}: streamed {nrows} records in {secs:.1f}s ({nrows / max(secs, 1e-9):.0f} records/s)')
+    return nrows
+
+
+def readconfig(configfile):
+    """Tables to sync from a YAML file like
+
+        schemas: output/airtable-schemas.json
+        tables:
+          hotline_database:
+            url: https://airtable.com/app.../tbl.../viw...
+            output: output/hotline.parquet
+
+    with any number of tables, from any number of bases.
+    """
+    with open(configfile, "r") as f:
+        config = yaml.safe_load(f)
+    assert 'tables' in config.keys(), f"Expected a `tables` section in {configfile}, found {config.keys()}"
+    tableinfo = {}
+    for label, table in config['tables'].items():
+        assert ('url' in table.keys()) & ('output' in table.keys()), f"\
+        Expected `url` and `output` for table {label}, found {table.keys()}"
+        info = processlink(url=table['url'])
+        assert (info['base_id'] is not None) & (info['table_id'] is not None), f"\
+        Could not find base and table IDs for {label} in {table['url']}"
+        tableinfo[label] = {**info, 'output': table['output']}
+    return config.get('schemas', 'output/airtable-schemas.json'), tableinfo
+
+
+def fetchschema(api, baseid, tableid, limiter=None):
+    """Field names and Arrow types from the metadata API, None where a type
+    has to be inferred from the data. Returns None if the table's metadata
+    can't be read, see `fetchtablemeta`.
+    """
+    meta = fetchtablemeta(api=api, baseid=baseid, tableid=tableid, limiter=limiter)
+    if meta is None: return None
+    return {field['name']: ARROW_TYPES.get(field['type']) for field in meta['fields']}
+
+
+def inferschema(records):
+    schema = flattenpage(records).schema
+    return pa.schema([field for field in schema if field.name not in ('recordid', 'date_created')])
+
+
+def fits(values, arrowtype):
+    try: typedcolumn(values, arrowtype)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError): return False
+    return True
+
+
+def refreshschema(schema, records, known=None):
+    """Widen `schema` with the fields in `records`: types from `known` (see
+    `fetchschema`) where it has them and these records' values fit them,
+    otherwise inferred from these records and reconciled with `schema` like
+    `ParquetStream` does, so conflicting types become text.
+    """
+    if known is None: known = {}
+    inferred = inferschema(records)
+    fields = {field.name: field for field in schema} if schema is not None else {}
+    for field in inferred:
+        arrowtype = known.get(field.name)
+        values = [record['fields'].get(field.name) for record in records]
+        if (arrowtype is not None) and fits(values, arrowtype): fields[field.name] = pa.field(field.name, arrowtype)
+        elif field.name not in fields.keys(): fields[field.name] = field
+        else: fields[field.name] = unifyfields([pa.schema([fields[field.name]]), pa.schema([field])]).field(0)
+    for name, arrowtype in known.items():
+        if (name not in fields.keys()) & (arrowtype is not None): fields[name] = pa.field(name, arrowtype)
+    return pa.schema(list(fields.values()))
+
+
+def typedcolumn(values, arrowtype):
+    """Date and time fields arrive as ISO strings, so they are cast after
+    building; text fields take any other value as text (see `stringvalues`).
+    """
+    if arrowtype == pa.string(): return stringvalues(values)
+    if pa.types.is_date(arrowtype) | pa.types.is_timestamp(arrowtype):
+        return pa.array(values, type=pa.string()).cast(arrowtype)
+    return pa.array(values, type=arrowtype)
+
+
+def typedpage(records, schema):
+    """One page as an Arrow table typed by the cached `schema`, without
+    discovering its fields; missing fields are nulls.
+    """
+    columns = [typedcolumn([record['fields'].get(field.name) for record in records], field.type)
+               for field in schema]
+    columns.append(pa.array([record['id'] for record in records], type=pa.string()))
+    columns.append(pa.array([record['createdTime'] for record in records], type=pa.string()))
+    return pa.Table.from_arrays(columns, names=schema.names + ['recordid', 'date_created'])
+
+
+class SchemaCache():
+    """
+    Arrow schema per table label, kept in a JSON file between runs so a
+    sync doesn't rediscover fields. Schemas are stored as base64 IPC bytes.
+    """
+
+    def __init__(self, cachefile):
+        self.cachefile = Path(cachefile)
+        self.schemas = {}
+        self.lock = threading.Lock()
+        if self.cachefile.exists():
+            with open(self.cachefile, "r") as f:
+                for label, encoded in json.load(f).items():
+                    self.schemas[label] = pa.ipc.read_schema(pa.py_buffer(base64.b64decode(encoded)))
+
+
+    def get(self, label):
+        return self.schemas.get(label)
+
+
+    def put(self, label, schema):
+        with self.lock:
+            self.schemas[label] = schema
+            encoded = {label: base64.b64encode(schema.serialize().to_pybytes()).decode()
+                       for label, schema in self.schemas.items()}
+            self.cachefile.parent.mkdir(parents=True, exist_ok=True)
+            tmp = Path(f"{self.cachefile}.tmp")
+            with open(tmp, "w") as f:
+                json.dump(encoded, f, indent=1)
+            tmp.replace(self.cachefile)
+        return schema
+
+
+def synctable(api, label, info, schemas, limiter=None, rowgroup=ROWGROUP):
+    """Stream one configured table to its output, typed by its cached schema.
+    The schema is only refreshed when a page has a field it doesn't know
+    or a value that doesn't fit its type, and only cached if the metadata
+    API could be read (a schema inferred from one page would otherwise
+    stick until the next unknown field).
+    """
+    start = time.perf_counter()
+    state = {'schema': schemas.get(label)}
+    def flatten(records):
+        if state['schema'] is not None:
+            fields = set().union(*[record['fields'].keys() for record in records])
+            if fields.issubset(state['schema'].names):
+                try: return typedpage(records, state['schema'])
+                except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError):
+                    logger.info(f'{label}: values no longer fit the cached schema')
+            else: logger.info(f'{label}: new fields {sorted(fields - set(state["schema"].names))}')
+        known = fetchschema(api=api, baseid=info['base_id'], tableid=info['table_id'], limiter=limiter)
+        state['schema'] = refreshschema(schema=state['schema'], records=records, known=known)
+        if known is not None: schemas.put(label, state['schema'])
+        else: logger.warning(f'{label}: using inferred types for this run only, schema not cached')
+        return typedpage(records, state['schema'])
+    stream = ParquetStream(outfile=info['output'], rowgroup=rowgroup, flatten=flatten)
+    try:
+        for page in iterpages(api=api, baseid=info['base_id'], tableid=info['table_id'], limiter=limiter):
+            stream.write(page)
+        nrows = stream.close()
+    except BaseException:
+        stream.discard()
+        raise
+    secs = time.perf_counter() - start
+    logger.info(f'{label}: synced {nrows} records in {secs:.1f}s ({nrows / max(secs, 1e-9):.0f} records/s)')
+    return nrows
+
+
+def readstate(statefile):
+    if not Path(statefile).exists(): return {}
+    with open(statefile, "r") as f:
+        return json.load(f)
+
+
+def writestate(statefile, state):
+    """Write to a temporary file first so a failed sync never leaves a half-written state."""
+    tmp = Path(f"{statefile}.tmp")
+    tmp.parent.mkdir(parents=True, exist_ok=True)
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=1)
+    tmp.replace(statefile)
+    return 1
+
+
+def modifiedformula(watermark, field=None):
+    modified = "LAST_MODIFIED_TIME()" if field is None else f"{{{field}}}"
+    return f"IS_AFTER({modified}, DATETIME_PARSE('{watermark}'))"
+
+
+def getchanges(api, baseid, tableid, watermark, field=None, limiter=None):
+    """Records created or modified after `watermark`, as `getformatrows` returns them."""
+    rows, pages = fetchrecords(
+        api=api, baseid=baseid, tableid=tableid, limiter=limiter, formula=modifiedformula(watermark, field))
+    return pd.DataFrame(rows, columns=['id', 'createdTime', 'fields'])
+
+
+def getids(api, baseid, tableid, field=None, limiter=None):
+    """Every record ID currently in the table, fetching only `field` (a name
+    or field ID) to keep pages small, or whole records without one.
+    """
+    options = {} if field is None else {'fields': [field]}
+    rows, pages = fetchrecords(api=api, baseid=baseid, tableid=tableid, limiter=limiter, **options)
+    return {row['id'] for row in rows}
+
+
+def mergetable(existing, changes, deleted):
+    """Replace changed records in `existing`, add new ones and drop deleted ones."""
+    stale = set(deleted)
+    if changes.shape[0] > 0: stale |= set(changes.id)
+    kept = existing.loc[~existing.recordid.isin(stale)]
+    if changes.shape[0] == 0: return kept.reset_index(drop=True)
+    merged = pd.concat([kept, formattable(table=changes)], ignore_index=True)
+    return merged.sort_values('date_created', kind='stable').reset_index(drop=True)
+
+
+def syncincremental(api, info, outfile, state, field=None, limiter=None, skew=SKEW):
+    """Sync one table into `outfile`, falling back to a full pull the first time.
+    Returns the table's new state: the watermark (`skew` seconds before this
+    sync started, so edits made while it runs, or hidden by a local clock
+    running ahead, are picked up next time) and record IDs.
+    """
+    started = (pd.Timestamp.now(tz='UTC') - pd.Timedelta(seconds=skew)).isoformat(
+        timespec='milliseconds').replace('+00:00', 'Z')
+    if (not state) | (not Path(outfile).exists()):
+        logger.info(f'no previous sync for {outfile}, pulling the full table')
+        table = formattable(table=getformatrows(
+            api=api, baseid=info['base_id'], tableid=info['table_id'], limiter=limiter))
+    else:
+        changes = getchanges(
+            api=api, baseid=info['base_id'], tableid=info['table_id'],
+            watermark=state['watermark'], field=field, limiter=limiter)
+        existing = pd.read_parquet(outfile)
+        # the primary field can't be deleted and its ID survives renames
+        meta = None if field else fetchtablemeta(
+            api=api, baseid=info['base_id'], tableid=info['table_id'], limiter=limiter)
+        keyfield = field if field else (meta['primaryFieldId'] if meta else None)
+        current = getids(
+            api=api, baseid=info['base_id'], tableid=info['table_id'], field=keyfield, limiter=limiter)
+        deleted = set(state['ids']) - current
+        logger.info(f'{changes.shape[0]} new or modified and {len(deleted)} deleted records since {state["watermark"]}')
+        table = mergetable(existing=existing, changes=changes, deleted=deleted)
+    table.to_parquet(outfile)
+    return {'watermark': started, 'ids': sorted(table.recordid)}
 # }}}
 
 # --- main --- {{{
 if __name__ == '__main__':
     args = getargs()
     setuplogging("output/sync.log")
-    api = at.Api(api_key=getcreds())
-    tableinfo = {
+    # 429s are retried by `requestpage`, so it can log and share the backoff with the rate limiter
+    api = at.Api(api_key=getcreds(), endpoint_url=args.endpoint, retry_strategy=None)
+    limiter = RateLimiter(rate=args.rate)
+    if args.config: schemafile, tableinfo = readconfig(args.config)
+    else: tableinfo = {
         label: processlink(url=link)
         for label, link in LINKS.items()
     }
+    workers = args.workers if args.workers else len(tableinfo)
 
-    logger.info('accessing & formatting table data as table')
-    tables = {
-        label: getformatrows(
-            api=api,
-            baseid=info['base_id'],
-            tableid=info['table_id'])
-        for label, info in tableinfo.items()
-    }
+    if args.incremental:
+        logger.info('syncing records modified since the last run')
+        state = readstate(args.state)
+        if args.config: outfiles = {label: info['output'] for label, info in tableinfo.items()}
+        else: outfiles = {'hotline_database': args.hotline, 'cw_hearings': args.hearings}
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                label: pool.submit(
+                    syncincremental, api=api, info=info, outfile=outfiles[label],
+                    state=state.get(label, {}), field=args.modified_field, limiter=limiter,
+                    skew=args.skew)
+                for label, info in tableinfo.items()
+            }
+            for label, future in futures.items(): state[label] = future.result()
+        writestate(args.state, state)
+    elif args.config:
+        logger.info(f'syncing {len(tableinfo)} configured tables with cached schemas')
+        schemas = SchemaCache(schemafile)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(
+                    synctable, api=api, label=label, info=info, schemas=schemas,
+                    limiter=limiter, rowgroup=args.rowgroup)
+                for label, info in tableinfo.items()
+            ]
+            for future in futures: future.result()
+    elif args.stream:
+        logger.info('streaming table pages to parquet row groups')
+        outfiles = {'hotline_database': args.hotline, 'cw_hearings': args.hearings}
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(
+                    streamtable, api=api, info=info, outfile=outfiles[label],
+                    limiter=limiter, rowgroup=args.rowgroup)
+                for label, info in tableinfo.items()
+            ]
+            for future in futures: future.result()
+    else:
+        logger.info('accessing & formatting table data as table')
+        tables = fetchtables(api=api, tableinfo=tableinfo, limiter=limiter, workers=workers)
 
-    logger.info('unpacking data in each table')
-    hotline = formattable(table=tables['hotline_database'])
-    hearings = formattable(table=tables['cw_hearings'])
+        logger.info('unpacking data in each table')
+        hotline = formattable(table=tables['hotline_database'])
+        hearings = formattable(table=tables['cw_hearings'])
 
-    logger.info('writing accessed and formatted datasets')
-    hotline.to_parquet(args.hotline)
-    hearings.to_parquet(args.hearings)
+        logger.info('writing accessed and formatted datasets')
+        hotline.to_parquet(args.hotline)
+        hearings.to_parquet(args.hearings)
 
     logger.info('done')
 # }}}
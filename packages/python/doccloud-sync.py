@@ -10,12 +10,41 @@
 from pathlib import Path
 from sys import stdout
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 from loguru import logger
+import os
+import random
 import re
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse
+import numpy as np
 import pandas as pd
+import requests
+import yaml
+from requests.adapters import HTTPAdapter
 from documentcloud import DocumentCloud
+from documentcloud.exceptions import APIError
 #}}}
 
+# requests per second across all threads, and how to retry transient errors
+WORKERS = 8
+RATE = 10
+RETRIES = 5
+BACKOFF = 1
+CHUNK = 2**20
+
+# record (RD) numbers in document titles, e.g. JG271294
+RD_PATTERN = re.compile(r"([A-Z]{1,2}[0-9]{5,7})")
+
+MANIFEST_COLS = ['fileid', 'filehash', 'last_update', 'path', 'localhash']
+
+# DocumentCloud's own defaults; point them at a local fake server for testing
+BASE_URI = "https://api.www.documentcloud.org/api/"
+AUTH_URI = "https://accounts.muckrock.com/api/"
+
 # --- support methods --- {{{
 def getargs():
     parser = argparse.ArgumentParser()
@@ -23,6 +52,22 @@ def getargs():
     parser.add_argument("--outdir", default=None)
     parser.add_argument("--outpdfs", default=None)
     parser.add_argument("--outannots", default=None)
+    parser.add_argument("--config", default=str(Path(__file__).with_suffix(".yaml")),
+                        help="YAML file with `rd_overrides` (fileid: rd) and optionally `expected_rds`, per project")
+    parser.add_argument("--outambiguous", default=None,
+                        help="parquet file listing documents without exactly one RD number in their title")
+    parser.add_argument("--manifest", default=None,
+                        help="parquet file recording downloaded pdfs, default {outdir}/manifest.parquet")
+    parser.add_argument("--verify", action="store_true",
+                        help="re-hash existing pdfs and download any that don't match the manifest")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="documents whose annotations or pdfs are fetched at once")
+    parser.add_argument("--rate", type=float, default=RATE,
+                        help="max DocumentCloud requests per second, shared by all workers")
+    parser.add_argument("--base-uri", default=os.environ.get("DOCCLOUD_BASE_URI", BASE_URI),
+                        help="DocumentCloud API root, e.g. a local fake server (or $DOCCLOUD_BASE_URI)")
+    parser.add_argument("--auth-uri", default=os.environ.get("DOCCLOUD_AUTH_URI", AUTH_URI),
+                        help="authentication API root (or $DOCCLOUD_AUTH_URI)")
     args = parser.parse_args()
     assert Path(args.outdir).exists()
     return args
@@ -36,11 +81,156 @@ def setuplogging(logfile):
     return 1
 
 
-def writepdf(fname, pdfbyts):
-    with open(fname, 'wb') as f:
-        f.write(pdfbyts)
-        f.close()
-    return True
+class ClientAuth(requests.auth.AuthBase):
+    """
+    The DocumentCloud client's token, read from `client.session.headers` on
+    every request so a refresh by the client is picked up, and only sent to
+    the API host (like `documentcloud`, asset hosts get no credentials).
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.host = urlparse(client.base_uri).netloc
+        self.lock = threading.Lock()
+
+
+    def __call__(self, request):
+        token = self.gettoken()
+        if (token is not None) and (urlparse(request.url).netloc == self.host):
+            request.headers['Authorization'] = token
+        return request
+
+
+    def gettoken(self):
+        return self.client.session.headers.get('Authorization')
+
+
+    def refresh(self, token):
+        """Refresh the client's tokens, unless another thread already replaced `token`."""
+        with self.lock:
+            if self.gettoken() == token: self.client._set_tokens()
+
+
+def getsession(workers=WORKERS, auth=None):
+    """One keep-alive session for all download threads, with a connection pool
+    big enough that no worker waits on another's connection.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.auth = auth
+    return session
+
+
+def streampdf(session, url, fname, chunksize=CHUNK):
+    """Stream `url` to `fname` a chunk at a time, hashing as it goes. The file is
+    written under a temporary name in the same directory and renamed when
+    complete, so an interrupted download never leaves a partial pdf behind.
+    """
+    start = time.perf_counter()
+    digest, nbytes = hashlib.sha1(), 0
+    fd, tmp = tempfile.mkstemp(dir=Path(fname).parent, suffix='.part')
+    try:
+        with session.get(url, stream=True, timeout=(10, 60)) as response, os.fdopen(fd, 'wb') as f:
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size=chunksize):
+                f.write(chunk)
+                digest.update(chunk)
+                nbytes += len(chunk)
+        os.replace(tmp, fname)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+    return {'bytes': nbytes, 'seconds': time.perf_counter() - start, 'localhash': digest.hexdigest()}
+
+
+def downloadpdfs(df, session, workers=WORKERS, limiter=None):
+    """Download `df.pdfurl` to `df.path`, `workers` at a time, and return one row
+    of stats per document (in `df` order). A 401/403 refreshes the session's
+    `ClientAuth` token and is retried once.
+    """
+    def refreshing(url, fname):
+        auth = session.auth
+        token = auth.gettoken() if auth is not None else None
+        try: return streampdf(session=session, url=url, fname=fname)
+        except requests.exceptions.HTTPError as err:
+            if (auth is None) or (err.response is None) or (err.response.status_code not in (401, 403)): raise
+            logger.info(f'download of {fname} got {err.response.status_code}, refreshing the token')
+            auth.refresh(token)
+            return streampdf(session=session, url=url, fname=fname)
+    def download(url, fname):
+        return withretries(
+            lambda: refreshing(url=url, fname=fname),
+            label=f'download of {fname}', limiter=limiter)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        stats = pd.DataFrame(list(pool.map(download, df['pdfurl'], df['path'])), index=df.index)
+    secs = time.perf_counter() - start
+    latency = stats['seconds'].quantile([.5, .9, 1])
+    logger.info(f'downloaded {stats.shape[0]} pdfs, {stats.bytes.sum() / 2**20:.1f}MB in {secs:.1f}s '
+                f'({stats.bytes.sum() / 2**20 / max(secs, 1e-9):.1f}MB/s); '
+                f'per file p50 {latency[.5]:.2f}s, p90 {latency[.9]:.2f}s, max {latency[1]:.2f}s')
+    return stats
+
+
+def hashfile(fname):
+    """sha1 of a local file, read in 1MB chunks (hashlib releases the GIL, so threads help)."""
+    digest = hashlib.sha1()
+    with open(fname, 'rb') as f:
+        while chunk := f.read(2**20): digest.update(chunk)
+    return digest.hexdigest()
+
+
+def readmanifest(fname):
+    if not Path(fname).exists(): return pd.DataFrame(columns=MANIFEST_COLS)
+    manifest = pd.read_parquet(fname)
+    assert set(MANIFEST_COLS).issubset(manifest.columns), f"\
+    Expected manifest columns {MANIFEST_COLS}, found {manifest.columns.tolist()}"
+    assert not manifest.fileid.duplicated().any()
+    return manifest
+
+
+def writemanifest(fname, manifest):
+    tmp = Path(f"{fname}.tmp")
+    manifest[MANIFEST_COLS].to_parquet(tmp, index=False)
+    tmp.replace(fname)
+    return fname
+
+
+def verifyfiles(manifest, workers=WORKERS):
+    """Whether each manifest entry's file still exists with the hash it was written with."""
+    def verify(path, localhash):
+        return Path(path).exists() and (hashfile(path) == localhash)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return pd.Series(
+            list(pool.map(verify, manifest['path'], manifest['localhash'])),
+            index=manifest.index, dtype=bool)
+
+
+def planpdfs(df, manifest, verify=False, workers=WORKERS):
+    """Which documents in `df` need downloading: new ones, ones whose file hash,
+    update time or local path changed since the manifest was written, ones
+    whose file is gone, and with `verify`, ones whose file no longer matches.
+    """
+    known = manifest.set_index('fileid')
+    if verify: known['ok'] = verifyfiles(manifest, workers=workers).to_numpy()
+    else: known['ok'] = known['path'].map(lambda path: Path(path).exists())
+    prev = known.reindex(df['fileid'])
+    same = ((prev['filehash'].to_numpy() == df['filehash'].to_numpy()) &
+            (pd.to_datetime(prev['last_update'], utc=True).to_numpy() ==
+             pd.to_datetime(df['last_update'], utc=True).to_numpy()) &
+            (prev['path'].to_numpy() == df['path'].to_numpy()) &
+            (prev['ok'].fillna(False).to_numpy(dtype=bool)))
+    return pd.Series(~same, index=df.index)
+
+
+def updatemanifest(manifest, df, localhash):
+    """Replace manifest entries for the documents in `df`, downloaded with `localhash`."""
+    fresh = df[['fileid', 'filehash', 'last_update', 'path']].assign(localhash=localhash)
+    kept = manifest.loc[~manifest.fileid.isin(fresh.fileid)]
+    if kept.shape[0] == 0: return fresh.reset_index(drop=True)
+    return pd.concat([kept[MANIFEST_COLS], fresh], ignore_index=True)
 
 
 def getcreds():
@@ -51,9 +241,9 @@ def getcreds():
     return found[0], found[1]
 
 
-def getclient():
+def getclient(base_uri=BASE_URI, auth_uri=AUTH_URI):
     user, pwd = getcreds()
-    client = DocumentCloud(username=user, password=pwd)
+    client = DocumentCloud(username=user, password=pwd, base_uri=base_uri, auth_uri=auth_uri)
     return client
 
 
@@ -84,21 +274,101 @@ def build_docdf(docs):
     return out
 
 
-def findrd(fname):
-    assert not pd.isna(fname)
-    found = re.findall(pattern="[A-Z]{1,2}[0-9]{5,7}", string=fname)
-    if not len(found) == 1: return None
-    return found[0]
-
-
-def addrd(df):
+def readconfig(configfile, projectid):
+    """Settings for `projectid`, empty if the file or the project isn't there."""
+    if (configfile is None) or (not Path(configfile).exists()):
+        logger.warning(f'no config at {configfile}, documents without a single rd will not be downloaded')
+        return {'rd_overrides': {}}
+    with open(configfile, "r") as f:
+        config = (yaml.safe_load(f) or {}).get(projectid) or {}
+    config['rd_overrides'] = {int(fileid): rd for fileid, rd in (config.get('rd_overrides') or {}).items()}
+    return config
+
+
+def extractrd(filenames, pattern=RD_PATTERN):
+    """Every RD number in each filename, from one `str.extractall` call.
+    Returns the RD for filenames with exactly one match (NA otherwise),
+    the number of matches per filename, and the matches themselves.
+    """
+    assert not filenames.isna().any()
+    found = filenames.astype(str).str.extractall(pattern)[0]
+    nfound = found.groupby(level=0).size().reindex(filenames.index, fill_value=0)
+    # not `xs`, which raises when nothing matched at all
+    first = found[found.index.get_level_values('match') == 0].droplevel('match').reindex(filenames.index)
+    return first.where(nfound == 1), nfound, found
+
+
+def addrd(df, overrides={}, expected=None):
+    """Add `rd` to the documents in `df`, using `overrides` (fileid: rd) for
+    documents whose title doesn't name exactly one RD. Also returns a side
+    table of those ambiguous documents, their candidates, and any override.
+    """
     copy = df.copy()
-    copy['rd'] = copy.filename.apply(findrd)
-    assert copy.rd.notna().sum() == 163
-    assert copy.rd.isna().sum() == 1
-    assert (copy.loc[copy.rd.isna(), 'fileid'] == 25211366).all()
-    copy.loc[(copy.rd.isna()) & (copy.fileid == 25211366), 'rd'] = "JG271294"
-    return copy
+    copy['rd'], nfound, found = extractrd(copy.filename)
+    ambiguous = copy.loc[nfound != 1, ['fileid', 'filename']].copy()
+    ambiguous['n_found'] = nfound[nfound != 1]
+    multiple = found.loc[found.index.get_level_values(0).isin(ambiguous.index)]
+    ambiguous['candidates'] = pd.Series(
+        [list(rds) for rds in np.split(
+            multiple.to_numpy(dtype=object), nfound[ambiguous.index].cumsum().to_numpy())[:-1]],
+        index=ambiguous.index, dtype=object)
+    ambiguous['override'] = ambiguous.fileid.map(overrides)
+    unknown = set(overrides.keys()) - set(copy.fileid)
+    if unknown: logger.warning(f'rd overrides for fileids not in the project: {sorted(unknown)}')
+    override = copy.fileid.map(overrides)
+    copy['rd'] = override.where(override.notna(), copy.rd)
+    if ambiguous.override.isna().any():
+        logger.warning(f'{ambiguous.override.isna().sum()} documents have no single rd and no override: '
+                       f'{ambiguous.loc[ambiguous.override.isna(), "fileid"].tolist()[:20]}')
+    if expected is not None:
+        assert copy.rd.notna().sum() == expected, f"Expected {expected} documents with an rd, found {copy.rd.notna().sum()}"
+    return copy, ambiguous
+
+
+class TokenBucket():
+    """Thread-safe token bucket: `acquire` blocks until a request is allowed."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = rate if capacity is None else capacity
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return 1
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def istransient(err):
+    """Connection drops, timeouts, 429s and 5xx responses are worth retrying."""
+    if isinstance(err, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)): return True
+    status = getattr(err, 'status_code', None)
+    if (status is None) and (getattr(err, 'response', None) is not None): status = err.response.status_code
+    return (status == 429) or ((status is not None) and (status >= 500))
+
+
+def withretries(func, label, limiter=None, retries=RETRIES):
+    """Call `func` after waiting on `limiter`, retrying transient errors with
+    jittered exponential backoff.
+    """
+    for attempt in range(retries + 1):
+        if limiter is not None: limiter.acquire()
+        try: return func()
+        except (APIError, requests.exceptions.RequestException) as err:
+            if (not istransient(err)) or (attempt == retries): raise
+            wait = BACKOFF * 2**attempt * random.uniform(1, 1.5)
+            logger.warning(f'{label} failed ({err}), retrying in {wait:.1f}s')
+            time.sleep(wait)
 
 
 def getannot(annotation):
@@ -115,8 +385,10 @@ def getannot(annotation):
     return info
 
 
-def formatannots(doc):
-    annots = doc.annotations.list()
+def formatannots(doc, limiter=None, retries=RETRIES):
+    annots = withretries(
+        lambda: list(doc.annotations.list()),
+        label=f'annotations for {doc.id}', limiter=limiter, retries=retries)
     if not any(annots): return pd.DataFrame()
     data = []
     for ea in annots:
@@ -131,12 +403,20 @@ def formatannots(doc):
     return out
 
 
-def build_annotdf(df):
+def build_annotdf(df, workers=WORKERS, rate=RATE):
+    """Annotations for every document in `df`, fetched `workers` documents at
+    a time under one shared rate limit, and stacked in document order.
+    """
+    limiter = TokenBucket(rate=rate)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        found = list(pool.map(lambda doc: formatannots(doc=doc, limiter=limiter), df['doc']))
+    secs = time.perf_counter() - start
+    logger.info(f'fetched annotations for {len(found)} documents in {secs:.1f}s ({len(found) / max(secs, 1e-9):.1f} documents/s)')
     data = []
-    for tup in df[['fileid', 'doc']].itertuples():
-        annots = formatannots(doc=tup.doc)
+    for fileid, annots in zip(df['fileid'], found):
         if annots.shape[0] == 0: continue
-        annots['fileid'] = tup.fileid
+        annots['fileid'] = fileid
         data.append(annots)
     assert len(data) >= 1
     out = pd.concat(data)
@@ -150,23 +430,39 @@ if __name__ == '__main__':
     setuplogging("output/sync.log")
 
     logger.info('(1/5) setting up Document Cloud API client')
-    client = getclient()
+    client = getclient(base_uri=args.base_uri, auth_uri=args.auth_uri)
 
     logger.info('(2/5) collecting project documents')
     project = client.projects.get_by_id(args.projectid)
     docs = project.document_list
     docsdf = build_docdf(docs=docs)
-    docsdf = addrd(df=docsdf)
+    config = readconfig(args.config, projectid=args.projectid)
+    docsdf, ambiguous = addrd(
+        df=docsdf, overrides=config['rd_overrides'], expected=config.get('expected_rds'))
+    if args.outambiguous: ambiguous.to_parquet(args.outambiguous)
 
     logger.info('(3/5) pulling annotations')
-    annotsdf = build_annotdf(df=docsdf)
-
-    logger.info(f'(4/5) writing pdf data locally in {args.outdir}')
-    docsdf['localcopy'] = docsdf[['rd', 'doc']].apply(
-        lambda row: writepdf(
-            fname=f"{args.outdir}/{row.rd}.pdf",
-            pdfbyts=row.doc.pdf),
-        axis=1)
+    annotsdf = build_annotdf(df=docsdf, workers=args.workers, rate=args.rate)
+
+    logger.info(f'(4/5) writing new or changed pdfs locally in {args.outdir}')
+    manifestfile = args.manifest if args.manifest else f"{args.outdir}/manifest.parquet"
+    manifest = readmanifest(manifestfile)
+    # pdfs are named by rd, so documents without one are listed but not downloaded
+    docsdf['localcopy'] = docsdf.rd.notna()
+    if not docsdf.localcopy.all():
+        logger.warning(f'skipping pdfs for {(~docsdf.localcopy).sum()} documents with no rd: '
+                       f'{docsdf.loc[~docsdf.localcopy, "fileid"].tolist()[:20]}')
+    docsdf['path'] = (args.outdir + "/" + docsdf.rd + ".pdf").where(docsdf.localcopy)
+    pdfsdf = docsdf.loc[docsdf.localcopy]
+    todo = planpdfs(df=pdfsdf, manifest=manifest, verify=args.verify, workers=args.workers)
+    logger.info(f'{todo.sum()} of {pdfsdf.shape[0]} pdfs are new or changed')
+    if todo.any():
+        session = getsession(workers=args.workers, auth=ClientAuth(client))
+        stats = downloadpdfs(
+            df=pdfsdf.loc[todo], session=session,
+            workers=args.workers, limiter=TokenBucket(rate=args.rate))
+        manifest = updatemanifest(manifest=manifest, df=pdfsdf.loc[todo], localhash=stats.localhash.tolist())
+        writemanifest(manifestfile, manifest)
 
     logger.info('(5/5) writing reference tables')
     docsdf.loc[:, docsdf.columns != 'doc'].to_parquet(args.outpdfs)
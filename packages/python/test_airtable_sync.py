@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# vim: set ts=4 sts=0 sw=4 si fenc=utf-8 et:
+# vim: set fdm=marker fmr={{{,}}} fdl=0 foldcolumn=4:
+# Authors:     BP
+# Maintainers: BP
+# Copyright:   2025, HRDAG, GPL v2 or later
+# =========================================
+
+# ---- dependencies {{{
+import importlib.util
+from pathlib import Path
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+import requests
+#}}}
+
+# the script's name isn't importable as a module
+spec = importlib.util.spec_from_file_location(
+    'airtable_sync', Path(__file__).resolve().parent / 'airtable-sync.py')
+sync = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(sync)
+
+# --- support methods --- {{{
+def fake_records(fields):
+    return [{'id': f'rec{i:04d}', 'createdTime': '2025-01-01T00:00:00.000Z', 'fields': f}
+            for i, f in enumerate(fields)]
+# }}}
+
+# --- tests --- {{{
+def test_formattable_keeps_ints_with_gaps(tmp_path):
+    table = pd.DataFrame(fake_records([{'Count': 3, 'Name': 'a'}, {'Name': 'b'}, {'Count': 4}]))
+    df = sync.formattable(table)
+    assert df['Count'].tolist() == [3, None, 4]
+    assert [type(v) for v in df['Count']] == [int, type(None), int]
+    assert df['Name'].tolist() == ['a', 'b', None]
+    df.to_parquet(tmp_path / 'out.parquet')
+    assert str(pq.read_schema(tmp_path / 'out.parquet').field('Count').type) == 'int64'
+
+
+def test_stream_keeps_conflicting_field_as_text(tmp_path):
+    outfile = tmp_path / 'out.parquet'
+    stream = sync.ParquetStream(outfile, rowgroup=2)
+    stream.write(fake_records([{'Score': 1}, {'Score': 2}]))
+    stream.write(fake_records([{'Score': '#ERROR'}, {'Score': 4, 'Tags': ['a']}]))
+    stream.write(fake_records([{'Tags': 'b'}]))
+    assert stream.close() == 5
+    assert pq.read_schema(outfile).field('Score').type == pa.string()
+    df = pd.read_parquet(outfile)
+    assert df['Score'].tolist()[:4] == ['1', '2', '#ERROR', '4']
+    assert df['Tags'].tolist()[3:] == ['["a"]', 'b']
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['out.parquet']
+
+
+def test_stream_failure_removes_parts(tmp_path, monkeypatch):
+    def iterpages(**kwargs):
+        yield fake_records([{'Score': 1}])
+        yield fake_records([{'Score': 'x', 'New': 1}])
+        raise requests.exceptions.ConnectionError('dropped')
+    monkeypatch.setattr(sync, 'iterpages', iterpages)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        sync.streamtable(api=None, info={'base_id': 'app', 'table_id': 'tbl'},
+                         outfile=tmp_path / 'out.parquet', rowgroup=1)
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.parametrize('known', [None, {'Score': pa.float64()}])
+def test_synctable_widens_cached_schema(tmp_path, monkeypatch, known):
+    pages = [fake_records([{'Score': 1}, {'Score': 2}]), fake_records([{'Score': '#ERROR'}, {'Score': 4}])]
+    monkeypatch.setattr(sync, 'iterpages', lambda **kwargs: iter(pages))
+    monkeypatch.setattr(sync, 'fetchschema', lambda **kwargs: known)
+    schemas = sync.SchemaCache(tmp_path / 'schemas.json')
+    schemas.put('t', pa.schema([pa.field('Score', pa.int64())]))
+    info = {'base_id': 'app', 'table_id': 'tbl', 'output': tmp_path / 'out.parquet'}
+    assert sync.synctable(api=None, label='t', info=info, schemas=schemas, rowgroup=2) == 4
+    df = pd.read_parquet(info['output'])
+    assert df['Score'].tolist() == ['1', '2', '#ERROR', '4']
+    cached = sync.SchemaCache(tmp_path / 'schemas.json').get('t')
+    assert cached.field('Score').type == (pa.int64() if known is None else pa.string())
+# }}}
+
+# done.
@@ -16,12 +16,23 @@ import yaml
 import time
 import random
 import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
+from urllib.parse import urlparse
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 import pandas as pd
 #}}}
 
+# politeness budget: requests in flight per host, and seconds between requests to a host
+PER_HOST = 2
+DELAY = (.5, 1.5)
+RETRIES = 5
+BACKOFF = .5
+WORKERS = 8
+
 # ---- support methods {{{
 def get_args():
     parser = argparse.ArgumentParser()
@@ -32,6 +43,11 @@ def get_args():
     parser.add_argument("--outdir", default=None)
     parser.add_argument("--ref_out", default=None)
     parser.add_argument("--rev_out", default=None)
+    parser.add_argument("--per_host", type=int, default=PER_HOST,
+                        help="max requests in flight to one host")
+    parser.add_argument("--delay", type=float, nargs=2, default=DELAY,
+                        help="min and max seconds between requests to one host")
+    parser.add_argument("--workers", type=int, default=WORKERS)
     args = parser.parse_args()
     assert Path(args.agents)
     assert Path(args.names)
@@ -72,29 +88,94 @@ def writefile(fname, data):
     return 1
 
 
-def get_user_agent():
-    idx = random.randint(0, len(users)-1)
-    return users[idx]
+def istransient(err):
+    """Connection drops, timeouts, 429s and 5xx responses are worth retrying."""
+    if isinstance(err, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)): return True
+    status = None if getattr(err, 'response', None) is None else err.response.status_code
+    return (status == 429) or ((status is not None) and (status >= 500))
+
+
+class Fetcher():
+    """
+    Shared keep-alive session for every request the scrape makes. At most
+    `per_host` requests are in flight to a host at once, and requests to a
+    host are spaced by a random delay in `delay`. Transient failures (see
+    `istransient`) are retried with a different user agent and jittered
+    backoff; anything else, like a 404, fails at once.
+    """
+
+    def __init__(self, users, per_host=PER_HOST, delay=DELAY, retries=RETRIES, timeout=30):
+        self.users = users
+        self.per_host = per_host
+        self.delay = delay
+        self.retries = retries
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=per_host)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+
+    def __host__(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.hosts:
+                self.hosts[host] = {'slots': threading.Semaphore(self.per_host),
+                                    'lock': threading.Lock(), 'next': 0}
+        return self.hosts[host]
+
+
+    def __wait__(self, host):
+        """Reserve the next polite time to hit `host` and sleep until then."""
+        with host['lock']:
+            now = time.monotonic()
+            start = max(now, host['next'])
+            host['next'] = start + random.uniform(*self.delay)
+        time.sleep(start - now)
+
+
+    def get_user_agent(self):
+        return random.choice(self.users)
+
+
+    def get(self, url):
+        """Response body for `url`, or None if every attempt failed."""
+        host = self.__host__(url)
+        for attempt in range(self.retries + 1):
+            with host['slots']:
+                self.__wait__(host)
+                try:
+                    response = self.session.get(
+                        url, headers={"User-Agent": self.get_user_agent()}, timeout=self.timeout)
+                    response.raise_for_status()
+                    return response.content
+                except requests.exceptions.RequestException as err:
+                    print(f'attempt {attempt + 1} failed for {url}: {err}')
+                    if not istransient(err): return None
+            if attempt < self.retries: time.sleep(BACKOFF * 2**attempt * random.uniform(1, 1.5))
+        return None
+
+
+    def map(self, func, items, workers=WORKERS):
+        """`func` over `items` on a thread pool, results in order; the per-host
+        limit, not `workers`, is what bounds the load on any one site.
+        """
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(func, items))
 
 
-def parse_link(url, agent):
-    res = requests.get(url, headers={"User-Agent" : agent})
-    html = res.content
+def parse_link(url, fetcher):
+    html = fetcher.get(url)
+    if html is None: return None
     parsed = BeautifulSoup(html, "html.parser")
     return parsed
 
 
-def try_parse(url, users):
+def try_parse(url, fetcher):
     print(f'parsing:\t{url}')
-    random.shuffle(users)
-    soup = None
-    for user in users:
-        try:
-            soup = parse_link(url=url, agent=user)
-            break
-        except:
-            time.sleep(.2)
-            continue
+    soup = parse_link(url=url, fetcher=fetcher)
     if pd.isna(soup):
         print(f'unable to parse URL')
         exit(1)
@@ -121,38 +202,29 @@ def unpack_revocations(domain, revocations):
     return out
 
 
-def get_file(fileurl, user):
-    response = requests.get(fileurl, headers={"User-Agent" : user})
-    return response.content
+def get_file(fileurl, fetcher):
+    return fetcher.get(fileurl)
 
 
-def try_download(outdir, url, users, fext):
+def try_download(outdir, url, fetcher, fext):
     print(f'attempting to download:\t{url}')
-    random.shuffle(users)
-    found, have = None, None
+    have = None
     filename = url[url.rfind('/')+1:url.rfind(fext)+len(fext)]
     filename = f'{outdir}/{filename}'
     if os.path.exists(filename): have = readfile(fname=filename)
-    for i in range(20):
-        user =  get_user_agent()
-        try:
-            found = get_file(fileurl=url, user=user)
-            if pd.isna(found): continue
-            if pd.notna(have):
-                if have == found:
-                    print(f'a file with the same name and contents already exists in {outdir}.')
-                else:
-                    print(f'a file with the same name already exists in {outdir} but the contents do not match. \
-                    Writing found data with the name filename as the root and todays date as suffix')
-                    filename = filename[-len(fext):] + time.strftime('%Y-%m-%d') + fext
-                    assert writefile(fname=filename, data=found)
+    found = get_file(fileurl=url, fetcher=fetcher)
+    if pd.notna(found):
+        if pd.notna(have):
+            if have == found:
+                print(f'a file with the same name and contents already exists in {outdir}.')
             else:
+                print(f'a file with the same name already exists in {outdir} but the contents do not match. \
+                Writing found data with the name filename as the root and todays date as suffix')
+                filename = filename[:-len(fext)] + time.strftime('%Y-%m-%d') + fext
                 assert writefile(fname=filename, data=found)
-                print(f"download successful")
-            break
-        except:
-            time.sleep(.2)
-            continue
+        else:
+            assert writefile(fname=filename, data=found)
+            print(f"download successful")
     if all([pd.isna(v) for v in (have, found)]):
         print(f'unable to parse URL')
         return None
@@ -188,13 +260,15 @@ if __name__ == '__main__':
     users = readyaml(args.agents)
     sitenames = readyaml(args.names)
     sitenames = pd.DataFrame(sitenames).T.reset_index(names='caseno')
-    soup = try_parse(url=args.url, users=users)
+    fetcher = Fetcher(users=users, per_host=args.per_host, delay=args.delay)
+    soup = try_parse(url=args.url, fetcher=fetcher)
     title = soup.title.string
     if title: print(f"page title:\t{title}")
     revocations = extract_revocations(html=soup, keyphrase='Commission-Information/Revocations')
     data = unpack_revocations(domain=args.domain, revocations=revocations)
-    data['filename'] = data.pdfurl.apply(
-        lambda x: try_download(outdir=args.outdir, url=x, users=users, fext='.pdf'))
+    data['filename'] = fetcher.map(
+        lambda x: try_download(outdir=args.outdir, url=x, fetcher=fetcher, fext='.pdf'),
+        data.pdfurl, workers=args.workers)
     assert data.filename.notna().all()
     data['fileid'] = data.filename.apply(hashfile)
     assert sitenames.shape[0] == data.shape[0]
@@ -7,35 +7,69 @@
 # =========================================
 
 # ---- dependencies {{{
-from scipy.stats import power_divergence
+import functools
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from scipy.special import comb, gammaln
+from scipy.stats import chi2, power_divergence
 #}}}
 
 DEFAULTS = {
     'SIG': 0.05,
     'DDOF': 0,
+    'MODE': 'asymptotic', # or 'exact', 'montecarlo', 'auto'
+    'REPS': 20000, # Monte Carlo samples
+    'BATCH': 5000,
+    'WORKERS': None, # process pool size for Monte Carlo, None to stay in-process
+    'SEED': 0,
 }
 
+MODES = ['asymptotic', 'exact', 'montecarlo', 'auto']
+# 'auto' keeps the asymptotic p-value when every expected count is at least MIN_EXPECTED,
+# otherwise enumerates outcomes exactly while there are at most EXACT_MAX of them;
+# an 'exact' MODE with more outcomes than that falls back to Monte Carlo too
+MIN_EXPECTED = 5
+EXACT_MAX = 250000
+# why a test used its mode, for the narrative
+REASONS = ['requested', 'auto', 'too many outcomes', 'no observations']
+
+TEST_PARAMS = ['MODE', 'REPS', 'BATCH', 'WORKERS', 'SEED']
+
 CENSUS_PARAMS = [
     'CENSUS_DICT',
     'OBSERVED_DICT',
     'NULL_PHRASE',
     'SIG',
     'DDOF',
-]
+] + TEST_PARAMS
 
 EQUAL_PARAMS = [
     'OBSERVED_DICT',
     'NULL_PHRASE',
     'SIG',
     'DDOF',
-]
+] + TEST_PARAMS
+
+BATCH_PARAMS = [
+    'OBSERVED_TABLE', # rows are tests, columns are groups
+    'CENSUS_TABLE', # optional, group proportions per test (or one row for all); equal proportions if missing
+    'NULL_PHRASE',
+    'SIG',
+    'DDOF',
+] + TEST_PARAMS
+
+ChisquareResult = namedtuple('ChisquareResult', ['statistic', 'pvalue'])
 
 # --- support methods --- {{{
 def format_longfloat(num):
     return float(f'{num:.3f}')
 
 
-def text_statistic(pcs, sig, n, df, null_phrase, exp=None):
+def text_statistic(pcs, sig, n, df, null_phrase, exp=None, mode='asymptotic', reps=None, reason='requested'):
+    if reason == 'no observations':
+        return f"\nThis test **could not be calculated** because there are no observations."
     rounded_stat = format_longfloat(pcs.statistic)
     rounded_pval = format_longfloat(pcs.pvalue)
     if rounded_pval == 0: rounded_pval = "< 0.0001"
@@ -44,11 +78,167 @@ def text_statistic(pcs, sig, n, df, null_phrase, exp=None):
     if pcs.pvalue < sig:
         newinfo += f"which is a statistically significant difference and rejects the null hypothesis that {null_phrase}. "
     else: newinfo += f"which is not statistically significant and fails to reject the null hypothesis that {null_phrase}. "
-    if n < 30: newinfo += f"However, the sample size of {n} is small."
+    if mode == 'exact':
+        if reason == 'auto': newinfo += f"Because some expected counts are below {MIN_EXPECTED}, this p-value is from an exact multinomial test."
+        else: newinfo += f"This p-value is from an exact multinomial test."
+    elif mode == 'montecarlo':
+        if reason == 'auto': newinfo += f"Because some expected counts are below {MIN_EXPECTED} and there are too many possible outcomes to enumerate, this p-value is from {reps:,} Monte Carlo samples."
+        elif reason == 'too many outcomes': newinfo += f"With a sample size of {n} there are too many possible outcomes for an exact test, so this p-value is from {reps:,} Monte Carlo samples."
+        else: newinfo += f"This p-value is from {reps:,} Monte Carlo samples."
+    elif n < 30: newinfo += f"However, the sample size of {n} is small."
     return newinfo
 
 
-def add_chisquare_census(censusdict, obsdict, null_phrase, sig, ddof):
+def getoption(params, key):
+    if key not in params.keys(): return DEFAULTS[key]
+    return params[key]
+
+
+def count_outcomes(n, k):
+    """How many ways `n` records can fall into `k` groups."""
+    return comb(n + k - 1, k - 1, exact=True)
+
+
+def choose_mode(obs, props):
+    """'asymptotic' if every expected count is at least MIN_EXPECTED, else 'exact'
+    while the number of possible outcomes is at most EXACT_MAX, else 'montecarlo'.
+    """
+    n, k = int(np.sum(obs)), len(obs)
+    if np.min(np.asarray(props) * n) >= MIN_EXPECTED: return 'asymptotic'
+    if count_outcomes(n, k) <= EXACT_MAX: return 'exact'
+    return 'montecarlo'
+
+
+@functools.lru_cache(maxsize=128)
+def exact_distribution(n, props):
+    """Every Pearson statistic possible with `n` records split over groups
+    with proportions `props` (a tuple), sorted, with the probability of
+    seeing at least each one. Outcomes are enumerated group by group as
+    arrays, accumulating each outcome's statistic and log probability.
+    Cached, since report cells share their census and often their n.
+    """
+    assert count_outcomes(n, len(props)) <= EXACT_MAX, f"\
+    Expected at most {EXACT_MAX} outcomes to enumerate, found {count_outcomes(n, len(props))}"
+    props = np.asarray(props, dtype=np.float64)
+    exp = props * n
+    remaining = np.array([n])
+    stat, logp = np.zeros(1), np.zeros(1)
+    for group in range(len(props)):
+        if group == len(props) - 1: counts = remaining
+        else:
+            sizes = remaining + 1
+            rows = np.repeat(np.arange(len(remaining)), sizes)
+            counts = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+            remaining, stat, logp = remaining[rows] - counts, stat[rows], logp[rows]
+        stat = stat + counts**2 / exp[group]
+        logp = logp + counts * np.log(props[group]) - gammaln(counts + 1)
+    stat, prob = stat - n, np.exp(logp + gammaln(n + 1))
+    order = np.argsort(stat)
+    stat, tail = stat[order], np.cumsum(prob[order][::-1])[::-1]
+    return stat, np.minimum(tail, 1.0)
+
+
+def exact_pvalue(obs, props):
+    """Exact multinomial p-value for the Pearson statistic: the probability
+    under `props` of every outcome with n = sum(obs) whose statistic is at
+    least the observed one.
+    """
+    obs, props = np.asarray(obs, dtype=np.int64), np.asarray(props, dtype=np.float64)
+    n = int(obs.sum())
+    assert n > 0, f"Expected at least one observation, found {n}"
+    exp = props * n
+    stat, tail = exact_distribution(n, tuple(props))
+    observed = ((obs - exp)**2 / exp).sum()
+    i = np.searchsorted(stat, observed * (1 - 1e-9), side='left')
+    if i == len(stat): return 0.0
+    return float(tail[i])
+
+
+def montecarlo_batch(obs, props, size, seed):
+    """How many of `size` multinomial samples have a Pearson statistic at least the observed one."""
+    obs, props = np.asarray(obs, dtype=np.int64), np.asarray(props, dtype=np.float64)
+    exp = props * obs.sum()
+    observed = ((obs - exp)**2 / exp).sum()
+    draws = np.random.default_rng(seed).multinomial(obs.sum(), props, size=size)
+    return int((((draws - exp)**2 / exp).sum(axis=1) >= observed * (1 - 1e-9)).sum())
+
+
+def montecarlo_pvalue(obs, props, reps, batch, workers, seed):
+    """Monte Carlo p-value from `reps` samples drawn in batches. Every batch
+    gets its own child of `seed`, so the p-value is the same whether the
+    batches run in-process or across `workers` processes.
+    """
+    assert np.sum(obs) > 0, f"Expected at least one observation, found {np.sum(obs)}"
+    sizes = [min(batch, reps - start) for start in range(0, reps, batch)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = [[obs]*len(sizes), [props]*len(sizes), sizes, seeds]
+    if workers is None: hits = sum(map(montecarlo_batch, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            hits = sum(pool.map(montecarlo_batch, *args))
+    return (hits + 1) / (reps + 1)
+
+
+def mode_pvalue(pcs, obs, props, params):
+    """Replace the asymptotic p-value in `pcs` according to the MODE in `params`,
+    returning the result, the mode actually used and why (one of REASONS).
+    Without observations there is no test, so the statistic and p-value are
+    nan and the mode is None.
+    """
+    mode = getoption(params, 'MODE')
+    assert mode in MODES, f"Expected MODE to be one of {MODES}, found {mode}"
+    if np.sum(obs) == 0:
+        return ChisquareResult(statistic=np.nan, pvalue=np.nan), None, 'no observations'
+    reason = 'requested'
+    if mode == 'auto': mode, reason = choose_mode(obs, props), 'auto'
+    if (mode == 'exact') & (count_outcomes(int(np.sum(obs)), len(obs)) > EXACT_MAX):
+        mode, reason = 'montecarlo', 'too many outcomes'
+    if mode == 'exact': pval = exact_pvalue(obs, props)
+    elif mode == 'montecarlo':
+        pval = montecarlo_pvalue(
+            obs, props,
+            reps=getoption(params, 'REPS'),
+            batch=getoption(params, 'BATCH'),
+            workers=getoption(params, 'WORKERS'),
+            seed=getoption(params, 'SEED'))
+    else: return pcs, mode, reason
+    return ChisquareResult(statistic=pcs.statistic, pvalue=pval), mode, reason
+
+
+def text_census(sig):
+    return f"""This test compares whether observed racial proportions \
+    match the proportion of each racial group in the general population.\
+    In interpreting the results, a p-value below {sig} will be considered statistically significant.\n"""
+
+
+def text_equal(sig):
+    return f"""This test compares whether observed racial proportions match the proportion of each racial group in the general population.\
+    In interpreting the results, a p-value below {sig} will be considered statistically significant.\n"""
+
+
+def chisquare_batch(obs, props=None, ddof=0):
+    """Pearson chi-square for every row of `obs` (tests x groups) at once.
+    `props` holds the expected group proportions, either per test or one
+    row shared by all tests; equal proportions if None. Expected counts are
+    rounded the same way `add_chisquare_census` rounds them.
+    Returns the statistics, p-values, sample sizes and degrees of freedom.
+    """
+    obs = np.asarray(obs, dtype=np.float64)
+    assert obs.ndim == 2, f"Expected a 2-D array of observed counts, found shape {obs.shape}"
+    n = obs.sum(axis=1)
+    df = obs.shape[1] - 1 - ddof
+    if props is None: exp = np.broadcast_to(n[:, None] / obs.shape[1], obs.shape)
+    else:
+        props = np.broadcast_to(np.asarray(props, dtype=np.float64), obs.shape)
+        exp = np.round(props * n[:, None], 5)
+        assert np.allclose(exp.sum(axis=1), n, rtol=1e-8), f"\
+        The sum of the observed frequencies must agree with the sum of the expected frequencies."
+    with np.errstate(divide='ignore', invalid='ignore'):
+        stat = ((obs - exp)**2 / exp).sum(axis=1)
+    return stat, chi2.sf(stat, df), n, df
+
+
+def add_chisquare_census(censusdict, obsdict, null_phrase, sig, ddof, options={}):
     if not sorted(obsdict.keys()) == sorted(censusdict.keys()):
         """This is intended to fill in 0 values for groups not represented in the summary counts."""
         for k in censusdict.keys():
@@ -66,39 +256,88 @@ def add_chisquare_census(censusdict, obsdict, null_phrase, sig, ddof):
     The sum of the observed frequencies must agree with \
     the sum of the expected frequencies, but {sum(obs_n)} != {sum(exp_n)}"
     pcs_county_n = power_divergence(f_obs=obs_n, f_exp=exp_n, ddof=ddof, lambda_ = "pearson")
-    chi_info = f"""This test compares whether observed racial proportions \
-    match the proportion of each racial group in the general population.\
-    In interpreting the results, a p-value below {sig} will be considered statistically significant.\n"""
+    props = np.array([censusdict[group]['prop'] for group in cats])
+    pcs_county_n, mode, reason = mode_pvalue(pcs_county_n, obs=obs_n, props=props / props.sum(), params=options)
+    chi_info = text_census(sig)
     chi_info += text_statistic(
         pcs=pcs_county_n,
         sig=sig,
         n=totalobs,
         df=df,
         null_phrase=null_phrase,
-        exp=exp_n
+        exp=exp_n,
+        mode=mode,
+        reps=getoption(options, 'REPS'),
+        reason=reason
     )
     return chi_info
 
 
-def add_chisquare_equal(obsdict, null_phrase, sig, ddof):
+def add_chisquare_equal(obsdict, null_phrase, sig, ddof, options={}):
     cats = obsdict.keys()
     # delta degrees of freedom ('ddof') and degrees of freedom ('df')
     df = len(cats) - 1 - ddof
     obs_n = [v for v in obsdict.values()]
     totalobs = sum(obs_n)
     pcs_obs_n = power_divergence(f_obs=obs_n, ddof=ddof, lambda_ = "pearson")
-    chi_info = f"""This test compares whether observed racial proportions match the proportion of each racial group in the general population.\
-    In interpreting the results, a p-value below {sig} will be considered statistically significant.\n"""
+    pcs_obs_n, mode, reason = mode_pvalue(pcs_obs_n, obs=obs_n, props=np.full(len(obs_n), 1 / len(obs_n)), params=options)
+    chi_info = text_equal(sig)
     chi_info += text_statistic(
         pcs=pcs_obs_n,
         sig=sig,
         n=totalobs,
         df=df,
         null_phrase=null_phrase,
+        mode=mode,
+        reps=getoption(options, 'REPS'),
+        reason=reason
     )
     return chi_info
 
 
+def add_chisquare_batch(obstable, censustable, null_phrase, sig, ddof, options={}):
+    """One row per test with its statistic, p-value and the same narrative
+    `add_chisquare_census` (or `add_chisquare_equal` without a census) gives.
+    Tests whose MODE (see `mode_pvalue`) is not asymptotic get their
+    p-value replaced one at a time after the vectorized pass.
+    """
+    obstable = pd.DataFrame(obstable).fillna(0)
+    if censustable is None: props, header = None, text_equal(sig)
+    else:
+        censustable = pd.DataFrame(censustable)
+        assert sorted(censustable.columns) == sorted(obstable.columns), f"\
+        Expected census table and observed table to have the same groups.\
+        Found census with {sorted(censustable.columns)} and observed with {sorted(obstable.columns)}."
+        censustable = censustable[obstable.columns]
+        if censustable.shape[0] == 1: props = censustable.to_numpy()
+        else: props = censustable.reindex(obstable.index).to_numpy()
+        header = text_census(sig)
+    obs = obstable.to_numpy()
+    stat, pval, n, df = chisquare_batch(obs, props=props, ddof=ddof)
+    modes = np.full(len(obs), 'asymptotic', dtype=object)
+    reasons = np.full(len(obs), 'requested', dtype=object)
+    # tests without observations go through `mode_pvalue` too, to come out as nan
+    rows = range(len(obs)) if getoption(options, 'MODE') != 'asymptotic' else np.flatnonzero(n == 0)
+    if len(rows):
+        if props is None: rowprops = np.full(obs.shape, 1 / obs.shape[1])
+        else: rowprops = np.broadcast_to(props, obs.shape)
+        for i in rows:
+            pcs, modes[i], reasons[i] = mode_pvalue(
+                ChisquareResult(statistic=stat[i], pvalue=pval[i]),
+                obs=obs[i], props=rowprops[i] / rowprops[i].sum(), params=options)
+            stat[i], pval[i] = pcs.statistic, pcs.pvalue
+    table = pd.DataFrame({'statistic': stat, 'pvalue': pval, 'n': n.astype(np.int64), 'df': df}, index=obstable.index)
+    table['mode'] = modes
+    table['reason'] = reasons
+    table['significant'] = table['pvalue'] < sig
+    table['info'] = [header + text_statistic(
+        pcs=ChisquareResult(statistic=s, pvalue=p),
+        sig=sig, n=int(k), df=df, null_phrase=null_phrase,
+        exp=props is not None, mode=m, reps=getoption(options, 'REPS'), reason=r)
+        for s, p, k, m, r in zip(stat, pval, n, modes, reasons)]
+    return table
+
+
 class Census():
     """
     Calculation:
@@ -129,7 +368,8 @@ class Census():
             obsdict=obsdict,
             null_phrase=null_phrase,
             sig=sig,
-            ddof=ddof
+            ddof=ddof,
+            options=self.params
         )
         self.info = info
         
@@ -171,7 +411,8 @@ class Equal():
             obsdict=obsdict,
             null_phrase=null_phrase,
             sig=sig,
-            ddof=ddof
+            ddof=ddof,
+            options=self.params
         )
         self.info = info
         
@@ -183,6 +424,49 @@ class Equal():
 
     def __str__(self):
         return self.getinfo()
+
+
+class Batch():
+    """
+    Calculation:
+    - Table: Pearson chi-square for every row of OBSERVED_TABLE in one vectorized pass
+    - Description: Census (with CENSUS_TABLE) or Equal (without) over many observed count sets
+    Present:
+    - Results table: statistic, p-value, n, df, mode (and why) and significance per test
+    - Finding: the `Census`/`Equal` narrative for each test
+    """
+
+    def __init__(self, params):
+        assert all([k in BATCH_PARAMS for k in params.keys()]), f"\
+        Expected only known parameters {BATCH_PARAMS}, found {params.keys()}"
+        self.params = params
+        self.table = None
+
+
+    def __settable__(self):
+        if 'SIG' not in self.params.keys(): sig = DEFAULTS['SIG']
+        else: sig = self.params['SIG']
+        if 'DDOF' not in self.params.keys(): ddof = DEFAULTS['DDOF']
+        else: ddof = self.params['DDOF']
+        if 'CENSUS_TABLE' not in self.params.keys(): censustable = None
+        else: censustable = self.params['CENSUS_TABLE']
+        self.table = add_chisquare_batch(
+            obstable=self.params['OBSERVED_TABLE'],
+            censustable=censustable,
+            null_phrase=self.params['NULL_PHRASE'],
+            sig=sig,
+            ddof=ddof,
+            options=self.params
+        )
+
+
+    def gettable(self):
+        if self.table is None: self.__settable__()
+        return self.table
+
+
+    def getinfo(self):
+        return self.gettable()['info']
 # }}}
 
 # done.
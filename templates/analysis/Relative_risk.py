@@ -8,11 +8,15 @@
 
 # ---- dependencies {{{
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 import numpy as np
 import pandas as pd
+from scipy.stats import norm
 
 sys.path.append(".")
 from build_html_table import get_table
+from build_crosstab import crosstab, title_categories
 #}}}
 
 CONTINGENCY_PARAMS = [
@@ -29,6 +33,32 @@ RATIO_PARAMS = [
     'GIVEN_EVENT_COL',
 ]
 
+# optional, for a confidence interval on the ratio
+CI_PARAMS = [
+    'CI_METHOD', # 'analytic' (log relative risk) or 'bootstrap'
+    'CI_LEVEL',
+    'CI_REPS',
+    'CI_BATCH',
+    'CI_WORKERS', # process pool size for the bootstrap, None to stay in-process
+    'CI_SEED',
+]
+
+CI_DEFAULTS = {
+    'CI_LEVEL': 0.95,
+    'CI_REPS': 10000,
+    'CI_BATCH': 2500,
+    'CI_WORKERS': None,
+    'CI_SEED': 0,
+}
+
+RATIO_MATRIX_PARAMS = [
+    'GROUP_COLS',
+    'OUTCOME_EVENT_OP',
+    'OUTCOME_EVENT_COL',
+    'GIVEN_EVENT_COL',
+    'PAIRS', # optional, list of (treat, control) columns; default is every ordered pair
+] + CI_PARAMS
+
 # --- support methods --- {{{
 def verifycols(df, cols):
     for col in cols:
@@ -94,6 +124,61 @@ def add_relrisk_results(treat_event, control_event, outcome_event, outcome_op, r
     return relrisk_info
 
 
+def relrisk_ci_analytic(treat_event, treat_noevent, control_event, control_noevent, level):
+    """Wald interval on the log relative risk, (nan, nan) if either group has no events."""
+    if (treat_event == 0) | (control_event == 0): return np.nan, np.nan
+    logrr = np.log(
+        (treat_event / (treat_event + treat_noevent)) / (control_event / (control_event + control_noevent)))
+    se = np.sqrt(
+        1/treat_event - 1/(treat_event + treat_noevent) + 1/control_event - 1/(control_event + control_noevent))
+    z = norm.ppf((1 + level) / 2)
+    return np.exp(logrr - z*se), np.exp(logrr + z*se)
+
+
+def bootstrap_relrisk(counts, size, seed):
+    """Relative risk for `size` multinomial redraws of the 2x2 `counts`
+    (treat event, treat no event, control event, control no event);
+    nan where a redraw leaves the ratio undefined.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    draws = np.random.default_rng(seed).multinomial(counts.sum(), counts / counts.sum(), size=size)
+    treat, control = draws[:, 0] + draws[:, 1], draws[:, 2] + draws[:, 3]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rr = (draws[:, 0] / treat) / (draws[:, 2] / control)
+    rr[~np.isfinite(rr)] = np.nan
+    return rr
+
+
+def relrisk_ci_bootstrap(treat_event, treat_noevent, control_event, control_noevent,
+                         level, reps, batch, workers, seed, pool=None):
+    """Percentile interval from `reps` bootstrap replicates, drawn in batches.
+    Every batch gets its own child of `seed`, so the interval is the same
+    whether the batches run in-process or across `workers` processes.
+    A running `pool` is used instead of starting one, see `RatioMatrix`.
+    (nan, nan) if either group has no events, like `relrisk_ci_analytic`.
+    """
+    # same as the analytic interval: no interval when the observed ratio is 0 or undefined
+    if (treat_event == 0) | (control_event == 0): return np.nan, np.nan
+    counts = [treat_event, treat_noevent, control_event, control_noevent]
+    sizes = [min(batch, reps - start) for start in range(0, reps, batch)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    if pool is not None: rrs = list(pool.map(bootstrap_relrisk, [counts]*len(sizes), sizes, seeds))
+    elif workers is None: rrs = list(map(bootstrap_relrisk, [counts]*len(sizes), sizes, seeds))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            rrs = list(pool.map(bootstrap_relrisk, [counts]*len(sizes), sizes, seeds))
+    rr = np.concatenate(rrs)
+    if np.isnan(rr).all(): return np.nan, np.nan
+    lower, upper = np.nanpercentile(rr, [(1 - level) / 2 * 100, (1 + level) / 2 * 100])
+    return lower, upper
+
+
+def add_relrisk_ci(method, level, lower, upper):
+    if np.isnan(lower) | np.isnan(upper):
+        return f"""The {level*100:g}% confidence interval ({method}) for this ratio **could not be calculated**.\n\n"""
+    return f"""The {level*100:g}% confidence interval ({method}) for this ratio is {lower:.3f} to {upper:.3f}.\n\n"""
+
+
 class Contingency():
     """
     Calculation:
@@ -124,11 +209,9 @@ class Contingency():
         magic = self.params
         # do we need to filter for candidates here like we do in the Ratio class?
         OUTCOME_EVENT_COL, GIVEN_EVENT_COL = magic['OUTCOME_EVENT_COL'], magic['GIVEN_EVENT_COL']
-        df = df.copy()
-        table = pd.crosstab(
+        table = crosstab(
             index=df.loc[df[GIVEN_EVENT_COL], OUTCOME_EVENT_COL],
             columns=df['race_ethnicity'],
-            margins=True, margins_name='Total'
             ).reindex([True, False, 'Total']).reset_index().rename(columns={
             OUTCOME_EVENT_COL: f'{self.labels[OUTCOME_EVENT_COL]} given {self.labels[GIVEN_EVENT_COL]}',})
         # this is where to swap in labels instead of T/F
@@ -147,7 +230,7 @@ class Contingency():
 
     def __settable__(self):
         """This is different than the methods to calculate the ratio,
-        because the `pd.crosstab()` method used to get the contingency table with marginal totals
+        because the `crosstab()` method used to get the contingency table with marginal totals
         works on categorical fields.
         Note: This is why the indicate task sets up the `outcome_*` and `comparison_group_*` columns.
         """
@@ -156,12 +239,10 @@ class Contingency():
         # do we need to filter for candidates here like we do in the Ratio class?
         COMPARISON_GROUP_COL, OUTCOME_EVENT_COL, GIVEN_EVENT_COL = magic[
             'COMPARISON_GROUP_COL'], magic['OUTCOME_EVENT_COL'], magic['GIVEN_EVENT_COL']
-        df = df.loc[df[COMPARISON_GROUP_COL].notna()].copy()
-        df[COMPARISON_GROUP_COL] = df[COMPARISON_GROUP_COL].str.title()
-        table = pd.crosstab(
+        # title-case the distinct group labels, not every record; missing groups drop out of the crosstab
+        table = crosstab(
             index=df.loc[df[GIVEN_EVENT_COL], OUTCOME_EVENT_COL],
-            columns=df[COMPARISON_GROUP_COL],
-            margins=True, margins_name='Total'
+            columns=title_categories(df[COMPARISON_GROUP_COL]),
             ).reindex([True, False, 'Total']).reset_index().rename(columns={
             OUTCOME_EVENT_COL: f'{self.labels[OUTCOME_EVENT_COL]} given {self.labels[GIVEN_EVENT_COL]}',})
         # this is where to swap in labels instead of T/F
@@ -202,14 +283,19 @@ class Ratio():
 
     def __init__(self, df, params, labels):
         self.df = df
-        assert sorted(params.keys()) == sorted(RATIO_PARAMS), f"\
-        Expected known parameters {RATIO_PARAMS}, \nfound {params.keys()}"
+        assert sorted([k for k in params.keys() if k not in CI_PARAMS]) == sorted(RATIO_PARAMS), f"\
+        Expected known parameters {RATIO_PARAMS} (and optionally {CI_PARAMS}), \nfound {params.keys()}"
+        if 'CI_METHOD' in params.keys(): assert params['CI_METHOD'] in ('analytic', 'bootstrap'), f"\
+        Expected CI_METHOD to be 'analytic' or 'bootstrap', found {params['CI_METHOD']}"
         assert verifycols(df, cols=[
             v for param, v in params.items() if '_COL' in param])
         self.params = params
         self.labels = labels
         self.magic = {}
         self.info = """"""
+        self.ci = {}
+        # process pool shared by several bootstraps, see `RatioMatrix.__setcis__`
+        self.pool = None
 
 
     def __setmagic__(self):
@@ -253,9 +339,36 @@ class Ratio():
             outcome_event=self.labels[self.magic['OUTCOME_EVENT_COL']],
             outcome_op=self.magic['OUTCOME_EVENT_OP'],
             rat=ratio)
+        if ('CI_METHOD' in self.params.keys()) & (type(ratio) is not str):
+            if self.ci == {}: self.__setci__()
+            info += add_relrisk_ci(
+                method=self.ci['CI_METHOD'],
+                level=self.ci['CI_LEVEL'],
+                lower=self.ci['CI_LOWER'],
+                upper=self.ci['CI_UPPER'])
         self.info = info
 
 
+    def __setci__(self):
+        ci = CI_DEFAULTS.copy()
+        ci.update({k: v for k, v in self.params.items() if k in CI_PARAMS})
+        if 'CI_METHOD' not in ci.keys(): ci['CI_METHOD'] = 'analytic'
+        counts = {
+            'treat_event': self.magic['TREAT_OUTCOME_SUM'],
+            'treat_noevent': self.magic['TREAT_NOOUTCOME_SUM'],
+            'control_event': self.magic['CONTROL_OUTCOME_SUM'],
+            'control_noevent': self.magic['CONTROL_NOOUTCOME_SUM'],
+        }
+        if ci['CI_METHOD'] == 'analytic':
+            lower, upper = relrisk_ci_analytic(**counts, level=ci['CI_LEVEL'])
+        else:
+            lower, upper = relrisk_ci_bootstrap(
+                **counts, level=ci['CI_LEVEL'], reps=ci['CI_REPS'], batch=ci['CI_BATCH'],
+                workers=ci['CI_WORKERS'], seed=ci['CI_SEED'], pool=self.pool)
+        ci['CI_LOWER'], ci['CI_UPPER'] = lower, upper
+        self.ci = ci
+
+
     def getinfo(self):
         if self.magic == {}: self.__setmagic__()
         if self.info == '': self.__setinfo__()
@@ -267,6 +380,13 @@ class Ratio():
         return self.magic
 
 
+    def getci(self):
+        """Confidence interval for the ratio, analytic unless CI_METHOD says otherwise."""
+        if self.magic == {}: self.__setmagic__()
+        if self.ci == {}: self.__setci__()
+        return self.ci
+
+
     def __str__(self):
         return self.info
 
@@ -277,6 +397,162 @@ class Ratio():
 
     def __dict__(self):
         return self.magic
+
+
+class RatioMatrix():
+    """
+    Calculation:
+    - Table: G.T @ [outcome, 1] and G.T @ G over the given records, where G holds every GROUP_COLS indicator
+    - Description: Event/no-event counts for every group in one pass, then the `Ratio` magic for any pair
+    Present:
+    - Ratio: relative risk for every (treat, control) pair in PAIRS
+    - Finding: the same narrative `Ratio.getinfo()` gives for each pair
+    """
+
+    def __init__(self, df, params, labels):
+        self.df = df
+        assert all([k in RATIO_MATRIX_PARAMS for k in params.keys()]), f"\
+        Expected known parameters {RATIO_MATRIX_PARAMS}, \nfound {params.keys()}"
+        assert all([k in params.keys() for k in RATIO_MATRIX_PARAMS if k not in ['PAIRS'] + CI_PARAMS]), f"\
+        Expected parameters {RATIO_MATRIX_PARAMS}, \nfound {params.keys()}"
+        assert verifycols(df, cols=list(params['GROUP_COLS']) + [
+            params['OUTCOME_EVENT_COL'], params['GIVEN_EVENT_COL']])
+        self.params = params
+        self.labels = labels
+        self.groups = list(params['GROUP_COLS'])
+        if 'PAIRS' in params.keys(): self.pairs = [tuple(pair) for pair in params['PAIRS']]
+        else: self.pairs = [(t, c) for t in self.groups for c in self.groups if t != c]
+        for pair in self.pairs:
+            assert all([col in self.groups for col in pair]), f"\
+            Expected pair {pair} to be made of GROUP_COLS {self.groups}"
+        self.counts = {}
+        self.magic = {}
+        self.ratios = {}
+
+
+    def __setcounts__(self):
+        """Event totals for each group (`EVENT`, `GIVEN`) and their overlaps
+        (`BOTH`, `BOTH_EVENT`) from matrix products over the given records,
+        so the union of any pair is available without going back to `df`.
+        """
+        df = self.df
+        given = df[self.params['GIVEN_EVENT_COL']].to_numpy(dtype=bool)
+        groups = df.loc[given, self.groups].to_numpy(dtype=np.float64)
+        outcome = df.loc[given, self.params['OUTCOME_EVENT_COL']].to_numpy(dtype=np.float64)
+        totals = groups.T @ np.column_stack([outcome, np.ones_like(outcome)])
+        self.counts = {
+            'EVENT': totals[:, 0].astype(np.int64),
+            'GIVEN': totals[:, 1].astype(np.int64),
+            'BOTH': (groups.T @ groups).astype(np.int64),
+            'BOTH_EVENT': ((groups * outcome[:, None]).T @ groups).astype(np.int64),
+        }
+
+
+    def __setmagic__(self, treat, control):
+        """Same dictionary `Ratio.getmagic()` returns for this pair."""
+        if self.counts == {}: self.__setcounts__()
+        counts = self.counts
+        t, c = self.groups.index(treat), self.groups.index(control)
+        magic = {
+            'TREAT_GROUP_COL': treat,
+            'CONTROL_GROUP_COL': control,
+            'OUTCOME_EVENT_OP': self.params['OUTCOME_EVENT_OP'],
+            'OUTCOME_EVENT_COL': self.params['OUTCOME_EVENT_COL'],
+            'GIVEN_EVENT_COL': self.params['GIVEN_EVENT_COL'],
+        }
+        magic['TREAT_GROUP_SUM'] = counts['GIVEN'][t]
+        magic['CONTROL_GROUP_SUM'] = counts['GIVEN'][c]
+        magic['OUTCOME_EVENT_SUM'] = counts['EVENT'][t] + counts['EVENT'][c] - counts['BOTH_EVENT'][t, c]
+        magic['GIVEN_EVENT_SUM'] = counts['GIVEN'][t] + counts['GIVEN'][c] - counts['BOTH'][t, c]
+        magic['TREAT_OUTCOME_SUM'] = counts['EVENT'][t]
+        magic['TREAT_NOOUTCOME_SUM'] = counts['GIVEN'][t] - counts['EVENT'][t]
+        magic['CONTROL_OUTCOME_SUM'] = counts['EVENT'][c]
+        magic['CONTROL_NOOUTCOME_SUM'] = counts['GIVEN'][c] - counts['EVENT'][c]
+        magic['TREAT_GIVEN_SUM'] = counts['GIVEN'][t]
+        magic['CONTROL_GIVEN_SUM'] = counts['GIVEN'][c]
+        self.magic[(treat, control)] = magic
+
+
+    def getmagic(self, treat, control):
+        if (treat, control) not in self.magic.keys(): self.__setmagic__(treat, control)
+        return self.magic[(treat, control)]
+
+
+    def getratio(self, treat, control):
+        """A `Ratio` for this pair with its magic already filled in."""
+        if (treat, control) in self.ratios.keys(): return self.ratios[(treat, control)]
+        ratio = Ratio(self.df, params={
+            'TREAT_GROUP_COL': treat,
+            'CONTROL_GROUP_COL': control,
+            'OUTCOME_EVENT_OP': self.params['OUTCOME_EVENT_OP'],
+            'OUTCOME_EVENT_COL': self.params['OUTCOME_EVENT_COL'],
+            'GIVEN_EVENT_COL': self.params['GIVEN_EVENT_COL'],
+            **{k: v for k, v in self.params.items() if k in CI_PARAMS},
+        }, labels=self.labels)
+        ratio.magic = self.getmagic(treat, control)
+        self.ratios[(treat, control)] = ratio
+        return ratio
+
+
+    def getinfo(self, treat, control):
+        return self.getratio(treat, control).getinfo()
+
+
+    def __setcis__(self):
+        """Intervals for every pair; bootstraps across CI_WORKERS processes
+        share one pool instead of starting one per pair.
+        """
+        workers = self.params.get('CI_WORKERS', CI_DEFAULTS['CI_WORKERS'])
+        shared = (self.params.get('CI_METHOD') == 'bootstrap') & (workers is not None)
+        with ProcessPoolExecutor(max_workers=workers) if shared else nullcontext() as pool:
+            for treat, control in self.pairs:
+                ratio = self.getratio(treat, control)
+                ratio.pool = pool
+                try: ratio.getci()
+                finally: ratio.pool = None
+
+
+    def getrisks(self):
+        """Relative risk of every group against every other, as a k x k table
+        (rows treat, columns control); NaN where the control group has no events.
+        """
+        if self.counts == {}: self.__setcounts__()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            risk = self.counts['EVENT'] / self.counts['GIVEN']
+            ratios = risk[:, None] / risk[None, :]
+        ratios[:, self.counts['EVENT'] == 0] = np.nan
+        return pd.DataFrame(ratios, index=self.groups, columns=self.groups)
+
+
+    def gettable(self):
+        """One row per requested pair with its counts, relative risk and narrative."""
+        risks = self.getrisks()
+        if 'CI_METHOD' in self.params.keys(): self.__setcis__()
+        rows = []
+        for treat, control in self.pairs:
+            magic = self.getmagic(treat, control)
+            rows.append({
+                'TREAT_GROUP_COL': treat,
+                'CONTROL_GROUP_COL': control,
+                'TREAT_OUTCOME_SUM': magic['TREAT_OUTCOME_SUM'],
+                'TREAT_NOOUTCOME_SUM': magic['TREAT_NOOUTCOME_SUM'],
+                'CONTROL_OUTCOME_SUM': magic['CONTROL_OUTCOME_SUM'],
+                'CONTROL_NOOUTCOME_SUM': magic['CONTROL_NOOUTCOME_SUM'],
+                'RELATIVE_RISK': risks.loc[treat, control],
+                'INFO': self.getinfo(treat, control),
+            })
+            if 'CI_METHOD' in self.params.keys():
+                ci = self.getratio(treat, control).getci()
+                rows[-1]['CI_LOWER'], rows[-1]['CI_UPPER'] = ci['CI_LOWER'], ci['CI_UPPER']
+        return pd.DataFrame(rows)
+
+
+    def __str__(self):
+        return ''.join([self.getinfo(treat, control) for treat, control in self.pairs])
+
+
+    def __repr__(self):
+        return str(self.magic)
 # }}}
 
 # done.
@@ -8,10 +8,12 @@
 
 # ---- dependencies {{{
 import sys
+import numpy as np
 import pandas as pd
 
 sys.path.append(".")
 from build_html_table import get_table
+from build_crosstab import crosstab, categorize
 #}}}
 
 PARAMS = [
@@ -28,27 +30,46 @@ def format_countperc(num, den):
     return f"{int(num)} ({prop*100:.1f}%)"
 
 
-def byeach_group(df, groupcol, eventcol, renamer):
-    #@TODO: update this method to use the `format_countperc` method
-    if df.shape[0] == df[eventcol].sum():
+def format_countpercs(num, den):
+    """Vectorized `format_countperc` over arrays of any (broadcastable) shape."""
+    num = np.asarray(num)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        prop = np.asarray(num / np.asarray(den), dtype=float)
+    counts = num.astype(np.int64).astype(str)
+    # crosstab percents repeat a lot, so only format the distinct ones
+    uniq, inverse = np.unique(prop*100, return_inverse=True)
+    percs = np.char.mod('%.1f', uniq)[inverse.reshape(prop.shape)]
+    return np.char.add(np.char.add(counts, ' ('), np.char.add(percs, '%)'))
+
+
+def format_countperc_cols(table, cols, dencol='Total'):
+    """Replace each of `cols` by its count with percent of `dencol`."""
+    den = table[dencol].to_numpy()
+    for col in cols:
+        table[col] = format_countpercs(num=table[col].to_numpy(), den=den)
+    return table
+
+
+def crosstab_event(df, groupcol, eventcol, givencol=None, groups=None):
+    """Counts of `eventcol` by `groupcol` with 'Total' margins,
+    restricted to records where `givencol` is True if given.
+    `groups` is `df[groupcol]` already run through `categorize`, if the
+    caller keeps one for repeated crosstabs.
+    """
+    if groups is None: groups = df[groupcol]
+    index = groups if givencol is None else groups.loc[df[givencol]]
+    return crosstab(index=index, columns=df[eventcol].rename(''))
+
+
+def byeach_group(df, groupcol, eventcol, renamer, xtab=None):
+    if xtab is None: xtab = crosstab_event(df=df, groupcol=groupcol, eventcol=eventcol)
+    if False not in xtab.columns:
         print(f"Expected at least one record with negative indicator, but \
-        all {df.shape[0]} records have positive {eventcol} value.")
+        all {xtab.loc['Total', 'Total']} records have positive {eventcol} value.")
         return None
-    nobs = df.shape[0]
-    table = pd.crosstab(
-        index=df[groupcol],
-        columns=df[eventcol].rename(''),
-        margins=True, margins_name='Total').reset_index().rename(columns=renamer)
-    table['true_prop'] = table[renamer[True]]/table.Total
-    table['false_prop'] = table[renamer[False]]/table.Total
-    #table['total_prop'] = table['Total']/nobs # @TODO: revisit how to best represent prop group total over all
-    table[renamer[True]] = table[[renamer[True], 'true_prop']].apply(
-        lambda row: f"{int(row[renamer[True]])} ({row.true_prop*100:.1f}%)", axis=1)
-    table[renamer[False]] = table[[renamer[False], 'false_prop']].apply(
-        lambda row: f"{int(row[renamer[False]])} ({row.false_prop*100:.1f}%)", axis=1)
-    #table['Total'] = table[['Total', 'total_prop']].apply(
-    #    lambda row: f"{int(row['Total'])} ({row.total_prop*100:.1f}%)", axis=1)
-    table = table[[c for c in table.columns if 'prop' not in c]]
+    table = xtab.reset_index().rename(columns=renamer)
+    # @TODO: revisit how to best represent prop group total over all
+    table = format_countperc_cols(table, cols=[renamer[True], renamer[False]])
     html = get_table(
         df=pd.DataFrame(table.to_dict()),
         font_size='11pt', font_family='Georgia', text_align='left',
@@ -62,34 +83,25 @@ def byeach_group(df, groupcol, eventcol, renamer):
     return html
 
 
-def byeach_event(df, groupcol, eventcol, renamer):
-    if df.shape[0] == df[eventcol].sum():
+def byeach_event(df, groupcol, eventcol, renamer, xtab=None):
+    if xtab is None: xtab = crosstab_event(df=df, groupcol=groupcol, eventcol=eventcol)
+    if False not in xtab.columns:
         print(f"Expected at least one record with negative indicator, but \
-        all {df.shape[0]} records have positive {eventcol} value.")
+        all {xtab.loc['Total', 'Total']} records have positive {eventcol} value.")
         return None
     # setup the core counts
     if eventcol in renamer.keys(): label = renamer[eventcol]
     else: label = ''
-    nobs = df.shape[0]
-    table = pd.crosstab(
-        index=df[groupcol],
-        columns=df[eventcol].rename(label),
-        margins=True, margins_name='Total').reset_index().rename(columns=renamer)
+    table = xtab.rename_axis(columns=label).reset_index().rename(columns=renamer)
     # format counts as f'{COUNT} ({PERC}%)'
     tablet = table.set_index(renamer[groupcol]).T
-    dencol = tablet['Total']
-    tableindex = tablet.index
     tofix = [c for c in tablet.columns if c != 'Total']
-    data = []
-    for col in tofix:
-        numcol = tablet[col]
-        countperc = [
-            format_countperc(num=numcol.values[rowi], den=dencol.values[rowi])
-            for rowi in range(3)]
-        info = pd.DataFrame(index=tableindex, columns=[col], data=countperc)
-        data.append(info.T)
-    data.append(pd.DataFrame(dencol).T)
-    table = pd.concat(data).T.reset_index()
+    countperc = pd.DataFrame(
+        format_countpercs(
+            num=tablet[tofix].to_numpy(), den=tablet[['Total']].to_numpy()),
+        index=tablet.index, columns=tofix)
+    countperc['Total'] = tablet['Total']
+    table = countperc.reset_index()
     # format as html
     html = get_table(
         df=pd.DataFrame(table.to_dict()),
@@ -104,21 +116,13 @@ def byeach_event(df, groupcol, eventcol, renamer):
     return html
 
 
-def by_conviction(df, givencol, groupcol, eventcol):
-    #@TODO: work in `format_countperc`
+def by_conviction(df, givencol, groupcol, eventcol, xtab=None):
     #@TODO: can this be another call to `byeach_group` instead?
-    table = pd.crosstab(
-        index=df.loc[df[givencol], groupcol],
-        columns=df[eventcol].rename(''),
-        margins=True, margins_name='Total').reset_index().rename(columns={
+    if xtab is None: xtab = crosstab_event(
+        df=df, groupcol=groupcol, eventcol=eventcol, givencol=givencol)
+    table = xtab.reset_index().rename(columns={
         False: 'No conviction', True: 'Any conviction', 'race_ethnicity': 'Recorded Race/Ethnicity',})
-    table['true_prop'] = table['Any conviction']/table.Total
-    table['false_prop'] = table['No conviction']/table.Total
-    table['Any conviction'] = table[['Any conviction', 'true_prop']].apply(
-        lambda row: f"{int(row['Any conviction'])} ({row.true_prop*100:.1f}%)", axis=1)
-    table['No conviction'] = table[['No conviction', 'false_prop']].apply(
-        lambda row: f"{int(row['No conviction'])} ({row.false_prop*100:.1f}%)", axis=1)
-    table = table[[c for c in table.columns if 'prop' not in c]]
+    table = format_countperc_cols(table, cols=['Any conviction', 'No conviction'])
     html = get_table(
         df=pd.DataFrame(table.to_dict()),
         color='grey_dark',
@@ -143,6 +147,33 @@ def report_outcome(item_i, magic, df, givencol, groupcol, eventcol):
 
 
 
+def fill_magic(magic, indicator_count, group_counts):
+    if 'RENAMER' not in magic.keys(): magic['RENAMER'] = {True: 'True', False: 'False'}
+    magic['INDICATOR_COUNT'] = indicator_count
+    magic['GROUP_COUNTS'] = group_counts.to_dict()
+    magic['GROUP_PERCENTS'] = (group_counts/indicator_count*100).to_dict()
+    assert magic['INDICATOR_COUNT'] == sum(magic['GROUP_COUNTS'].values()), f"\
+    Missing group placeholder value for some indicated records."
+    return magic
+
+
+def crosstab_counts(true, total, groupcol):
+    """Same table as `crosstab_event`, built from per-group counts of
+    True records (`true`) and of all records (`total`).
+    """
+    true, total = true[total > 0], total[total > 0]
+    false = total - true
+    data = {}
+    if (false > 0).any(): data[False] = false
+    if (true > 0).any(): data[True] = true
+    xtab = pd.DataFrame(data, index=total.index)
+    xtab.columns = pd.Index(list(xtab.columns), dtype=object, name='')
+    xtab.index = pd.Index(list(xtab.index), dtype=object, name=groupcol)
+    xtab['Total'] = xtab.sum(axis=1)
+    xtab.loc['Total'] = xtab.sum()
+    return xtab
+
+
 def verifycols(df, cols):
     for col in cols:
         assert col in df.columns, f"\
@@ -165,97 +196,183 @@ class Summary():
         - Of the {INDICATOR_COL.sum()},
             - {magic['GROUP_COUNTS'][GROUP_LABEL]} were for {GROUP_LABEL}
             - (repeated for each group appearing in GROUP_COL)
+
+    Derived artifacts (magic, info, categorized groups, crosstabs, tables)
+    are computed at most once and cached until `df` or `params` is
+    reassigned, `params` is edited in place, or `invalidate()` is called.
+    `cachestats()` reports hits and misses per artifact.
     """
 
     def __init__(self, df, params, labels):
-        self.df = df
         assert all([k in PARAMS] for k in params.keys()), f"\
         Expected  only known parameters {PARAMS}, found {params.keys()}"
         assert verifycols(df, cols=[
             v for param, v in params.items() if '_COL' in param])
-        self.params = params
+        self.cache = {}
+        self.stats = {}
+        self._df = df
+        self._params = params
         self.labels = labels
-        self.magic = {}
-        self.info = """"""
-        self.label = """"""
-        self.table_wingroup = None
-        self.table_winevent = None
+        self.invalidate()
+
+
+    @property
+    def df(self):
+        return self._df
+
+
+    @df.setter
+    def df(self, df):
+        self._df = df
+        self.invalidate()
+
+
+    @property
+    def params(self):
+        return self._params
+
+
+    @params.setter
+    def params(self, params):
+        self._params = params
+        self.invalidate()
+
+
+    def invalidate(self):
+        self.cache = {}
+        self.paramskey = repr(self._params)
+
+
+    def preset(self, **artifacts):
+        """Seed cached artifacts computed elsewhere, see `SummaryBatch`."""
+        if repr(self._params) != self.paramskey: self.invalidate()
+        self.cache.update(artifacts)
+
+
+    def __cached__(self, key, build):
+        if repr(self._params) != self.paramskey: self.invalidate()
+        stats = self.stats.setdefault(key, {'hits': 0, 'misses': 0})
+        if key in self.cache:
+            stats['hits'] += 1
+        else:
+            stats['misses'] += 1
+            self.cache[key] = build()
+        return self.cache[key]
+
+
+    def cachestats(self):
+        return {key: dict(stats) for key, stats in self.stats.items()}
 
 
     def __setmagic__(self):
         df = self.df
-        magic = self.params
-        if 'RENAMER' not in magic.keys(): magic['RENAMER'] = {True: 'True', False: 'False'}
-        INDICATOR_COL, INDICATOR_OP, GROUP_COL = magic[
-            'INDICATOR_COL'], magic['INDICATOR_OP'], magic['GROUP_COL']
-        magic['INDICATOR_COUNT'] = df[INDICATOR_COL].sum()
-        magic['GROUP_COUNTS'] = df[[INDICATOR_COL, GROUP_COL]
-            ].groupby(GROUP_COL)[INDICATOR_COL].sum().to_dict()
-        magic['GROUP_PERCENTS'] = (df[[INDICATOR_COL, GROUP_COL]
-            ].groupby(GROUP_COL)[INDICATOR_COL].sum(
-            )/magic['INDICATOR_COUNT']*100).to_dict()
-        assert magic['INDICATOR_COUNT'] == sum(magic['GROUP_COUNTS'].values()), f"\
-        Missing group placeholder value for some indicated records."
-        self.magic = magic
+        INDICATOR_COL, GROUP_COL = self.params['INDICATOR_COL'], self.params['GROUP_COL']
+        return fill_magic(
+            magic=self.params.copy(),
+            indicator_count=df[INDICATOR_COL].sum(),
+            group_counts=df[[INDICATOR_COL, GROUP_COL]].groupby(GROUP_COL)[INDICATOR_COL].sum())
 
 
     def __setinfo__(self):
-        info = f"""Of the {self.magic['INDICATOR_COUNT']} {
-            self.labels[self.magic['INDICATOR_COL']]},"""
-        for GROUP_LABEL, GROUP_IND_SUM in self.magic['GROUP_COUNTS'].items():
-            info += f"\n-  {GROUP_IND_SUM} or {self.magic['GROUP_PERCENTS'][GROUP_LABEL]:.1f}% {
-                self.magic['INDICATOR_OP']} {self.labels[self.magic['GROUP_COL']]} {GROUP_LABEL}."
-        self.info = info
+        magic = self.magic
+        info = f"""Of the {magic['INDICATOR_COUNT']} {
+            self.labels[magic['INDICATOR_COL']]},"""
+        for GROUP_LABEL, GROUP_IND_SUM in magic['GROUP_COUNTS'].items():
+            info += f"\n-  {GROUP_IND_SUM} or {magic['GROUP_PERCENTS'][GROUP_LABEL]:.1f}% {
+                magic['INDICATOR_OP']} {self.labels[magic['GROUP_COL']]} {GROUP_LABEL}."
+        return info
 
 
-    def __settables__(self):
-        label = f"""Of the {self.df.shape[0]:,} cases considered, there are {
+    def __setlabel__(self):
+        return f"""Of the {self.df.shape[0]:,} cases considered, there are {
             self.magic['INDICATOR_COUNT']} {
             self.labels[self.magic['INDICATOR_COL']]
             }, with the following distribution:\n"""
-        self.label = label
+
+
+    def __setgroups__(self):
+        return categorize(self.df[self.params['GROUP_COL']])
+
+
+    def __setxtab__(self):
+        return crosstab_event(
+            df=self.df, groupcol=self.magic['GROUP_COL'], eventcol=self.magic['INDICATOR_COL'],
+            groups=self.__cached__('groups', self.__setgroups__))
+
+
+    def __setxtab_given__(self):
+        return crosstab_event(
+            df=self.df, # should there be a given col here, or should we expect the user to pass filtered data?
+            groupcol=self.magic['GROUP_COL'],
+            eventcol=self.magic['INDICATOR_COL'],
+            givencol=self.magic['INDICATOR_COL'].replace('_wconv', ''),
+            groups=self.__cached__('groups', self.__setgroups__))
+
+
+    def __setwingroup__(self):
         if '_wconv' in self.magic['INDICATOR_COL']:
-            html_wingroup = by_conviction(
-                df=self.df, # should there be a given col here, or should we expect the user to pass filtered data?
-                givencol=self.magic['INDICATOR_COL'].replace('_wconv', ''),
-                groupcol=self.magic['GROUP_COL'],
-                eventcol=self.magic['INDICATOR_COL'])
-            self.table_wingroup = html_wingroup
-        else:
-            html_wingroup = byeach_group(
-                df=self.df,
-                groupcol=self.magic['GROUP_COL'],
-                eventcol=self.magic['INDICATOR_COL'],
-                renamer=self.magic['RENAMER'])
-            html_winevent = byeach_event(
+            return by_conviction(
                 df=self.df,
+                givencol=self.magic['INDICATOR_COL'].replace('_wconv', ''),
                 groupcol=self.magic['GROUP_COL'],
                 eventcol=self.magic['INDICATOR_COL'],
-                renamer=self.magic['RENAMER'])
-            self.table_wingroup = html_wingroup
-            self.table_winevent = html_winevent
+                xtab=self.__cached__('xtab_given', self.__setxtab_given__))
+        return byeach_group(
+            df=self.df,
+            groupcol=self.magic['GROUP_COL'],
+            eventcol=self.magic['INDICATOR_COL'],
+            renamer=self.magic['RENAMER'],
+            xtab=self.__cached__('xtab', self.__setxtab__))
+
+
+    def __setwinevent__(self):
+        if '_wconv' in self.magic['INDICATOR_COL']: return None
+        return byeach_event(
+            df=self.df,
+            groupcol=self.magic['GROUP_COL'],
+            eventcol=self.magic['INDICATOR_COL'],
+            renamer=self.magic['RENAMER'],
+            xtab=self.__cached__('xtab', self.__setxtab__))
+
+
+    @property
+    def magic(self):
+        return self.__cached__('magic', self.__setmagic__)
+
+
+    @property
+    def info(self):
+        return self.__cached__('info', self.__setinfo__)
+
+
+    @property
+    def label(self):
+        return self.__cached__('label', self.__setlabel__)
+
+
+    @property
+    def table_wingroup(self):
+        return self.__cached__('table_wingroup', self.__setwingroup__)
+
+
+    @property
+    def table_winevent(self):
+        return self.__cached__('table_winevent', self.__setwinevent__)
 
 
     def getmagic(self):
-        if self.magic == {}: self.__setmagic__()
         return self.magic
 
 
     def getinfo(self):
-        if self.magic == {}: self.__setmagic__()
-        if self.info == '': self.__setinfo__()
         return self.info
 
 
     def gettable_wingroup(self):
-        if self.magic == {}: self.__setmagic__()
-        if not self.table_wingroup: self.__settables__()
         return self.label, self.table_wingroup
 
 
     def gettable_winevent(self):
-        if self.magic == {}: self.__setmagic__()
-        if not self.table_winevent: self.__settables__()
         return self.label, self.table_winevent
 
 
@@ -269,6 +386,70 @@ class Summary():
 
     def __dict__(self):
         return self.magic
+
+
+class SummaryBatch():
+    """
+    Calculation:
+    - Table: df.groupby(GROUP_COL)[INDICATOR_COLS].sum(), once per GROUP_COL
+    - Description: Counts, percents and crosstabs for every INDICATOR_COL x GROUP_COL
+      pair, from one grouped aggregation over all indicators at once.
+      `*_wconv` indicators are also counted among records where the matching
+      given column (the name without `_wconv`) is True.
+    Present:
+    - Summary views: `getsummary(params)` returns a `Summary` for one
+      INDICATOR_COL/GROUP_COL pair with its magic and crosstabs already filled in
+    """
+
+    def __init__(self, df, indicator_cols, group_cols, labels):
+        self.df = df
+        self.indicator_cols = list(indicator_cols)
+        self.group_cols = list(group_cols)
+        self.givens = {
+            col: col.replace('_wconv', '') for col in self.indicator_cols if '_wconv' in col}
+        assert verifycols(df, cols=self.indicator_cols + self.group_cols + list(self.givens.values()))
+        self.labels = labels
+        self.counts = {}
+
+
+    def __setcounts__(self, GROUP_COL):
+        df = self.df
+        data = {col: df[col] for col in self.indicator_cols}
+        for col, given in self.givens.items():
+            data[given] = df[given]
+            data[f"{given}&{col}"] = df[given] & df[col]
+        grouped = pd.DataFrame(data).groupby(df[GROUP_COL], dropna=False, observed=True)
+        sums = grouped.sum()
+        sums['Total'] = grouped.size()
+        # the NaN group only counts toward INDICATOR_COUNT, like `df[col].sum()`
+        self.counts[GROUP_COL] = (sums.sum(), sums.loc[sums.index.notna()])
+
+
+    def getcounts(self, GROUP_COL):
+        if GROUP_COL not in self.counts: self.__setcounts__(GROUP_COL)
+        return self.counts[GROUP_COL]
+
+
+    def getsummary(self, params):
+        INDICATOR_COL, GROUP_COL = params['INDICATOR_COL'], params['GROUP_COL']
+        assert INDICATOR_COL in self.indicator_cols, f"\
+        Expected one of the batch indicators {self.indicator_cols}, found {INDICATOR_COL}"
+        assert GROUP_COL in self.group_cols, f"\
+        Expected one of the batch groups {self.group_cols}, found {GROUP_COL}"
+        totals, sums = self.getcounts(GROUP_COL)
+        summary = Summary(df=self.df, params=params, labels=self.labels)
+        magic = fill_magic(
+            magic=params.copy(),
+            indicator_count=totals[INDICATOR_COL],
+            group_counts=sums[INDICATOR_COL])
+        xtabs = {'xtab': crosstab_counts(
+            true=sums[INDICATOR_COL], total=sums['Total'], groupcol=GROUP_COL)}
+        if INDICATOR_COL in self.givens:
+            given = self.givens[INDICATOR_COL]
+            xtabs['xtab_given'] = crosstab_counts(
+                true=sums[f"{given}&{INDICATOR_COL}"], total=sums[given], groupcol=GROUP_COL)
+        summary.preset(magic=magic, **xtabs)
+        return summary
 # }}}
 
 # done.
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# vim: set ts=4 sts=0 sw=4 si fenc=utf-8 et:
+# vim: set fdm=marker fmr={{{,}}} fdl=0 foldcolumn=4:
+# Authors:     BP
+# Maintainers: BP
+# Copyright:   2025, HRDAG, GPL v2 or later
+# =========================================
+
+# ---- dependencies {{{
+import sys
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.append(".")
+from build_html_table import get_table, _get_table_rowwise
+#}}}
+
+STYLE = {
+    'color': 'grey_dark',
+    'font_size': '11pt',
+    'font_family': 'Georgia',
+    'text_align': 'left',
+    'width': 'auto',
+    'index': True,
+    'font_color': 'black',
+    'padding': '4px',
+}
+
+# --- support methods --- {{{
+def getargs():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10,1000,100000")
+    parser.add_argument("--rowwise-max", type=int, default=10000,
+                        help="skip the row-wise renderer above this many rows")
+    args = parser.parse_args()
+    return args
+
+
+def fake_crosstab(nrows, seed=0):
+    """Mimics the formatted tables `Summary` hands to `get_table`, plus an
+    unformatted float column so the float path is compared too.
+    """
+    rng = np.random.default_rng(seed)
+    true = rng.integers(0, 500, nrows)
+    false = rng.integers(0, 500, nrows)
+    total = true + false
+    return pd.DataFrame({
+        'Recorded Race/Ethnicity': [f'group {i}' for i in range(nrows)],
+        'True': [f"{t} ({t/n*100:.1f}%)" for t, n in zip(true, total)],
+        'False': [f"{f} ({f/n*100:.1f}%)" for f, n in zip(false, total)],
+        'Total': total,
+        'Rate': np.where(total > 0, true / np.maximum(total, 1), np.nan),
+    })
+
+
+def timeit(func, df):
+    start = time.perf_counter()
+    out = func(df=df, **STYLE)
+    return time.perf_counter() - start, out
+# }}}
+
+# --- main --- {{{
+if __name__ == '__main__':
+    args = getargs()
+    print(f"{'rows':>8} {'rowwise (s)':>12} {'single-pass (s)':>16} {'speedup':>8}")
+    for nrows in [int(n) for n in args.sizes.split(',')]:
+        df = fake_crosstab(nrows)
+        new_t, new = timeit(get_table, df)
+        if nrows > args.rowwise_max:
+            print(f"{nrows:>8} {'skipped':>12} {new_t:>16.4f} {'':>8}")
+            continue
+        old_t, old = timeit(_get_table_rowwise, df)
+        assert old == new, f"renderers disagree at {nrows} rows"
+        print(f"{nrows:>8} {old_t:>12.4f} {new_t:>16.4f} {old_t/new_t:>7.0f}x")
+# }}}
+
+# done.
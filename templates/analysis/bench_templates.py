@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# vim: set ts=4 sts=0 sw=4 si fenc=utf-8 et:
+# vim: set fdm=marker fmr={{{,}}} fdl=0 foldcolumn=4:
+# Authors:     BP
+# Maintainers: BP
+# Copyright:   2025, HRDAG, GPL v2 or later
+# =========================================
+
+# ---- dependencies {{{
+import sys
+import argparse
+import json
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+sys.path.append(".")
+import Summary
+import Relative_risk
+import Chi_square
+from build_crosstab import crosstab
+from build_html_table import get_table
+from result_cache import ResultCache
+#}}}
+
+GROUPS = ['black', 'white', 'latine', 'asian', 'other']
+GROUP_PROBS = [.3, .3, .2, .1, .08] # the rest is 'unknown' race_ethnicity
+EVENTS = ['filed', 'convicted', 'sentenced']
+CENSUS = {'black': {'prop': .25}, 'white': {'prop': .4}, 'latine': {'prop': .2},
+          'asian': {'prop': .1}, 'other': {'prop': .05}}
+
+# --- support methods --- {{{
+def getargs():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10000,1000000",
+                        help="comma-separated row counts, e.g. 10000,1000000,10000000")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="output/bench_templates.json")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="skip tracemalloc, which slows down the timed phases")
+    args = parser.parse_args()
+    return args
+
+
+def fake_cases(nrows, seed=0):
+    """Synthetic case table shaped like the indicate task's output: a
+    `race_ethnicity` column with an 'unknown' placeholder, boolean event
+    indicators, `*_wconv` indicators (event with a conviction),
+    `is_*` group indicators and `comparison_group_*` columns holding
+    the group name for the two compared groups and None otherwise.
+    """
+    rng = np.random.default_rng(seed)
+    codes = rng.choice(len(GROUPS) + 1, nrows, p=GROUP_PROBS + [1 - sum(GROUP_PROBS)])
+    race = np.array(GROUPS + ['unknown'], dtype=object)[codes]
+    df = pd.DataFrame({'race_ethnicity': race})
+    df['filed'] = rng.random(nrows) < .6
+    df['convicted'] = df['filed'] & (rng.random(nrows) < .45 + .05*(codes == 0))
+    df['sentenced'] = df['convicted'] & (rng.random(nrows) < .7)
+    for event in ('filed', 'sentenced'): df[f'{event}_wconv'] = df[event] & df['convicted']
+    for i, group in enumerate(GROUPS): df[f'is_{group}'] = codes == i
+    for other in ('white', 'latine'):
+        df[f'comparison_group_black_{other}'] = np.where(
+            codes == 0, 'black', np.where(codes == GROUPS.index(other), other, None))
+    return df
+
+
+def getlabels():
+    labels = {'race_ethnicity': 'race/ethnicity'}
+    labels.update({event: f'cases {event}' for event in EVENTS})
+    labels.update({f'{event}_wconv': f'cases {event} with a conviction' for event in ('filed', 'sentenced')})
+    labels.update({f'is_{group}': f'{group} people' for group in GROUPS})
+    return labels
+
+
+def measure(func, memory=True):
+    """Seconds and peak traced bytes for one call of `func`."""
+    if memory:
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - start
+    peak = None
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return seconds, peak
+
+
+def phases(df, labels, cachedir):
+    """(template, phase, func) triples, run in order; a render phase reuses
+    whatever its template's compute phase left cached. Contingency doesn't
+    cache its crosstab, so its phases are timed apart and then end to end.
+    A Summary is also loaded through a `ResultCache` in `cachedir`, cold
+    and then warm.
+    """
+    summary = Summary.Summary(df, {
+        'INDICATOR_COL': 'filed_wconv', 'INDICATOR_OP': 'were', 'GROUP_COL': 'race_ethnicity'}, labels)
+    batch = Summary.SummaryBatch(df, ['filed', 'convicted', 'sentenced', 'filed_wconv', 'sentenced_wconv'],
+                                 ['race_ethnicity'], labels)
+    contingency = Relative_risk.Contingency(df, {
+        'COMPARISON_GROUP_COL': 'comparison_group_black_white',
+        'OUTCOME_EVENT_COL': 'convicted', 'GIVEN_EVENT_COL': 'filed'}, labels)
+    ratio = Relative_risk.Ratio(df, {
+        'TREAT_GROUP_COL': 'is_black', 'CONTROL_GROUP_COL': 'is_white', 'OUTCOME_EVENT_OP': 'were',
+        'OUTCOME_EVENT_COL': 'convicted', 'GIVEN_EVENT_COL': 'filed'}, labels)
+    matrix = Relative_risk.RatioMatrix(df, {
+        'GROUP_COLS': [f'is_{group}' for group in GROUPS], 'OUTCOME_EVENT_OP': 'were',
+        'OUTCOME_EVENT_COL': 'convicted', 'GIVEN_EVENT_COL': 'filed'}, labels)
+    cache = ResultCache(cachedir=cachedir)
+    cached = lambda: cache.load(Summary.Summary(df, {
+        'INDICATOR_COL': 'filed_wconv', 'INDICATOR_OP': 'were', 'GROUP_COL': 'race_ethnicity'}, labels),
+        getters=['getinfo', 'gettable_wingroup']).getinfo()
+    xtab = {}
+    return [
+        ('Summary', 'compute', lambda: (summary.getinfo(), summary.__cached__('xtab', summary.__setxtab__))),
+        ('Summary', 'render', lambda: (summary.gettable_wingroup(), summary.gettable_winevent())),
+        ('SummaryBatch', 'compute', lambda: [batch.getsummary({
+            'INDICATOR_COL': col, 'INDICATOR_OP': 'were', 'GROUP_COL': 'race_ethnicity'}).getinfo()
+            for col in batch.indicator_cols]),
+        ('Contingency', 'compute', lambda: xtab.update(table=crosstab(
+            index=df.loc[df['filed'], 'convicted'], columns=df['comparison_group_black_white']))),
+        ('Contingency', 'render', lambda: get_table(
+            df=xtab['table'].reset_index(), color='grey_dark', font_size='12pt', font_family='Georgia',
+            text_align='left', padding='4px', index=True, font_color='black', even_bg_color='white')),
+        ('Contingency', 'total', lambda: contingency.gettable()),
+        ('Ratio', 'compute', lambda: ratio.getmagic()),
+        ('Ratio', 'render', lambda: ratio.getinfo()),
+        ('RatioMatrix', 'compute', lambda: matrix.getrisks()),
+        ('RatioMatrix', 'render', lambda: matrix.gettable()),
+        ('Census', 'compute', lambda: Chi_square.Census({
+            'CENSUS_DICT': CENSUS, 'NULL_PHRASE': 'x',
+            'OBSERVED_DICT': df.loc[df['race_ethnicity'] != 'unknown', 'race_ethnicity'].value_counts().to_dict()}).getinfo()),
+        ('Equal', 'compute', lambda: Chi_square.Equal({
+            'NULL_PHRASE': 'x', 'OBSERVED_DICT': df['race_ethnicity'].value_counts().to_dict()}).getinfo()),
+        ('ResultCache', 'miss', cached),
+        ('ResultCache', 'hit', cached),
+    ]
+
+
+def getcommit():
+    try: return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except FileNotFoundError: return None
+# }}}
+
+# --- main --- {{{
+if __name__ == '__main__':
+    args = getargs()
+    labels = getlabels()
+    results = {
+        'started': pd.Timestamp.now().isoformat(),
+        'commit': getcommit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'runs': [],
+    }
+    print(f"{'rows':>10} {'template':<14} {'phase':<8} {'seconds':>9} {'peak MB':>9}")
+    for nrows in [int(n) for n in args.sizes.split(',')]:
+        start = time.perf_counter()
+        df = fake_cases(nrows, seed=args.seed)
+        results['runs'].append({'rows': nrows, 'template': 'fake_cases', 'phase': 'generate',
+                                'seconds': time.perf_counter() - start, 'peak_bytes': None})
+        with tempfile.TemporaryDirectory() as cachedir:
+            for template, phase, func in phases(df, labels, cachedir):
+                seconds, peak = measure(func, memory=not args.no_memory)
+                results['runs'].append({'rows': nrows, 'template': template, 'phase': phase,
+                                        'seconds': seconds, 'peak_bytes': peak})
+                peakmb = '' if peak is None else f"{peak / 2**20:.1f}"
+                print(f"{nrows:>10} {template:<14} {phase:<8} {seconds:>9.4f} {peakmb:>9}")
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, 'w') as f: json.dump(results, f, indent=1)
+    print(f"wrote {args.output}")
+# }}}
+
+# done.
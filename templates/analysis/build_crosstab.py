@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# vim: set ts=4 sts=0 sw=4 si fenc=utf-8 et:
+# vim: set fdm=marker fmr={{{,}}} fdl=0 foldcolumn=4:
+# Authors:     BP
+# Maintainers: BP
+# Copyright:   2025, HRDAG, GPL v2 or later
+# =========================================
+
+# ---- dependencies {{{
+import numpy as np
+import pandas as pd
+#}}}
+
+# --- support methods --- {{{
+def getcodes(values):
+    """Integer codes (-1 for missing) and sorted categories of `values`.
+
+    Categorical columns reuse their codes and category order as is,
+    numpy booleans map straight to 0/1, and anything else (object,
+    Arrow-backed, nullable) is factorized once with sorted uniques,
+    which is the row/column order `pd.crosstab` would give it.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return np.asarray(values.cat.codes, dtype=np.intp), values.cat.categories
+    if values.dtype == bool:
+        return values.to_numpy().astype(np.intp), pd.Index([False, True], dtype=object)
+    codes, uniques = pd.factorize(values, sort=True)
+    return codes.astype(np.intp), pd.Index(uniques)
+
+
+def categorize(values):
+    """`values` as a categorical Series, so repeated crosstabs skip factorizing."""
+    if isinstance(values.dtype, pd.CategoricalDtype): return values
+    codes, categories = getcodes(values)
+    return pd.Series(
+        pd.Categorical.from_codes(codes, categories=categories),
+        index=values.index, name=values.name)
+
+
+def title_categories(values):
+    """Categorical version of `values.str.title()`.
+
+    Only the distinct labels are title-cased; records are remapped by code,
+    and labels that collide once title-cased are merged, same as the
+    string method followed by a crosstab would.
+    """
+    codes, categories = getcodes(values)
+    titled = pd.Index(categories.astype(str)).str.title()
+    remap, uniques = pd.factorize(titled, sort=True)
+    remap = np.append(remap, -1).astype(np.intp)
+    return pd.Series(
+        pd.Categorical.from_codes(remap[codes], categories=uniques),
+        index=values.index, name=values.name)
+
+
+def crosstab(index, columns, margins_name='Total'):
+    """Same table as `pd.crosstab(index, columns, margins=True, margins_name=...)`.
+
+    Counts come from a single `np.bincount` over the joint category codes
+    instead of a groupby/pivot. Records missing either key are dropped,
+    as are categories without any records, and the rows/columns keep the
+    ordering and default names `pd.crosstab` uses.
+    """
+    if not index.index.equals(columns.index):
+        index, columns = index.align(columns, join='inner')
+    rowcodes, rowcats = getcodes(index)
+    colcodes, colcats = getcodes(columns)
+    keep = (rowcodes >= 0) & (colcodes >= 0)
+    nrows, ncols = len(rowcats), len(colcats)
+    counts = np.bincount(
+        rowcodes[keep] * ncols + colcodes[keep],
+        minlength=nrows * ncols).reshape(nrows, ncols)
+    rowmask, colmask = counts.sum(axis=1) > 0, counts.sum(axis=0) > 0
+    counts = counts[rowmask][:, colmask]
+    counts = np.vstack([
+        np.hstack([counts, counts.sum(axis=1, keepdims=True)]),
+        np.append(counts.sum(axis=0), counts.sum())])
+    return pd.DataFrame(
+        counts,
+        index=pd.Index(list(rowcats[rowmask]) + [margins_name], name='row_0' if index.name is None else index.name),
+        columns=pd.Index(list(colcats[colmask]) + [margins_name], name='col_0' if columns.name is None else columns.name))
+# }}}
+
+# done.
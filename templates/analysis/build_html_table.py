@@ -5,6 +5,13 @@
 # this version forks to address that.
 
 import io
+import sys
+import functools
+import numpy as np
+import pandas as pd
+from pandas.api.types import (
+    infer_dtype, is_bool_dtype, is_integer_dtype, is_object_dtype, is_string_dtype)
+from pandas.io.formats.format import format_array
 
 # Reformat table_color as dict of tuples
 
@@ -24,7 +31,410 @@ dict_colors = {
 }
 
 
-def get_table(
+def header_style(header_background_color, font_color, font_family, font_size,
+                 color, text_align, border_bottom, padding, width):
+    return ('<th style = "background-color: ' + header_background_color
+            + '; color: ' + font_color
+            + ';font-family: ' + font_family
+            + ';font-size: ' + str(font_size)
+            + ';color: ' + color
+            + ';text-align: ' + text_align
+            + ';border-bottom: ' + border_bottom
+            + ';padding: ' + padding
+            + ';width: ' + str(width) + '">')
+
+
+def cell_style(tag, background_color, font_color, font_family, font_size,
+               text_align, padding, width):
+    return ('<' + tag + ' style = "background-color: ' + background_color
+            + '; color: ' + font_color
+            + ';font-family: ' + font_family
+            + ';font-size: ' + str(font_size)
+            + ';text-align: ' + text_align
+            + ';padding: ' + padding
+            + ';width: ' + str(width) + '">')
+
+
+SEP = '\x00'
+
+
+def _replace_all(strs, pairs):
+    """Run `str.replace` over a whole column at once by joining it first."""
+    joined = SEP.join(strs)
+    if joined.count(SEP) != max(len(strs) - 1, 0):
+        for old, new in pairs:
+            strs = [s.replace(old, new) for s in strs]
+        return strs
+    for old, new in pairs:
+        if old in joined: joined = joined.replace(old, new)
+    return joined.split(SEP) if strs else []
+
+
+def _escape_cells(strs, escape):
+    """Same text transform `DataFrame.to_html` applies to each cell."""
+    strs = [s.strip() for s in strs]
+    pairs = [('&', '&amp;'), ('<', '&lt;'), ('>', '&gt;')] if escape else []
+    return _replace_all(strs, pairs + [('  ', '&nbsp;&nbsp;')])
+
+
+def _format_floats(values):
+    """`format_array` of each float in `values` formatted alone, in one pass.
+
+    Same steps `FloatArrayFormatter` takes for a single value: fixed-point
+    at `display.precision` digits, trailing zeros trimmed to one, and
+    scientific notation for tiny values or long, large ones.
+    Returns None when display options would change that, so the caller can
+    fall back to `format_array`.
+    """
+    if (pd.get_option('display.float_format') is not None
+            or pd.get_option('display.chop_threshold') is not None):
+        return None
+    digits = pd.get_option('display.precision')
+    # compared in the array's own dtype, as `FloatArrayFormatter` does
+    sizes = np.abs(values)
+    small = ((sizes < 10 ** (-digits)) & (sizes > 0)).tolist()
+    large = (sizes > 1e6).tolist()
+    out = []
+    for v, is_small, is_large in zip(values.tolist(), small, large):
+        s = f"{v: .{digits}f}"
+        if s[-1].isdigit():
+            s = s.rstrip('0')
+            if s.endswith('.'): s += '0'
+        if is_small or (is_large and len(s) > digits + 6):
+            s = f"{v: .{digits}e}"
+        out.append(s)
+    return out
+
+
+def _format_column(col, float_format, escape):
+    """Format one column the way per-row `to_html` calls would.
+
+    Integer, boolean and string columns format the same jointly or one value
+    at a time, so they are converted a whole column at a time.
+    Floats, datetimes etc. depend on their neighbours when formatted jointly,
+    so each distinct value is formatted alone and broadcast back by code;
+    floats do that in one pass with `_format_floats`.
+    """
+    # same array `to_html` hands to `format_array` (DatetimeArray etc. unwrapped)
+    values = col._values
+    if float_format is None and isinstance(values, np.ndarray):
+        if values.dtype.kind in 'iu':
+            return values.astype(str).tolist()
+        if values.dtype.kind == 'b':
+            return np.where(values, 'True', 'False').tolist()
+    if (is_object_dtype(col.dtype) and infer_dtype(values, skipna=True) in ('string', 'empty')
+            or isinstance(col.dtype, pd.StringDtype) and col.dtype.na_value is np.nan):
+        if isinstance(values, np.ndarray):
+            strs = [s if isinstance(s, str) else '' for s in values.tolist()]
+        else:
+            strs = values.to_numpy(dtype=object, na_value='').tolist()
+        # `format_array` shows control characters escaped
+        strs = _replace_all(strs, [('\t', '\\t'), ('\r', '\\r'), ('\n', '\\n')])
+        return _escape_cells(strs, escape)
+    if (is_integer_dtype(col.dtype) or is_bool_dtype(col.dtype)
+            or is_object_dtype(col.dtype) or is_string_dtype(col.dtype)):
+        out = format_array(values, None, float_format=float_format, na_rep='')
+        return _escape_cells(out, escape)
+
+    def format_one(value):
+        out = format_array(value, None, float_format=float_format, na_rep='')
+        return _escape_cells(out, escape)[0]
+
+    codes, uniques = pd.factorize(values)
+    formatted = None
+    if (float_format is None and isinstance(uniques, np.ndarray)
+            and uniques.dtype.kind == 'f'):
+        formatted = _format_floats(uniques)
+        if formatted is not None: formatted = _escape_cells(formatted, escape)
+    if formatted is None:
+        formatted = [format_one(uniques[j:j + 1]) for j in range(len(uniques))]
+    missing = np.flatnonzero(codes == -1)
+    if len(missing):
+        # na_rep is ignored for some dtypes (e.g. NaT), so format a real one
+        formatted.append(format_one(values[missing[0]:missing[0] + 1]))
+    return [formatted[c] for c in codes]
+
+
+def _can_render_fast(df, index):
+    if isinstance(df.columns, pd.MultiIndex) or df.columns.name is not None:
+        return False
+    if index:
+        if isinstance(df.index, pd.MultiIndex) or df.index.name is not None:
+            return False
+        if infer_dtype(df.index, skipna=False) not in ('integer', 'string'):
+            return False
+    return True
+
+
+class Theme():
+    """Styled `<th>`/`<td>` prefixes for one combination of styling arguments.
+
+    Prefixes and row templates are built on first use and kept on the
+    object, so tables rendered with the same theme reuse them.
+    `hits`/`misses` count lookups answered from / added to that store.
+    """
+
+    def __init__(self, color, font_size, font_family, text_align, width, font_color,
+                 even_bg_color, odd_bg_color, border_bottom_color, padding):
+        color, border_bottom, odd_background_color, header_background_color = dict_colors[color]
+        if odd_bg_color:
+            odd_background_color = odd_bg_color
+        if border_bottom_color:
+            border_bottom = border_bottom_color
+        self.color = color
+        self.border_bottom = border_bottom
+        self.header_background_color = header_background_color
+        # 1st, 3rd, ... rows then 2nd, 4th, ... rows
+        self.backgrounds = (odd_background_color, even_bg_color)
+        self.font_color = font_color
+        self.font_family = font_family
+        self.font_size = font_size
+        self.text_align = text_align
+        self.padding = padding
+        self.width = width
+        self.prefixes = {}
+        self.hits = 0
+        self.misses = 0
+
+
+    def __lookup__(self, key, build):
+        if key in self.prefixes:
+            self.hits += 1
+        else:
+            self.misses += 1
+            self.prefixes[key] = build()
+        return self.prefixes[key]
+
+
+    def header(self, width=None):
+        width = self.width if width is None else width
+        return self.__lookup__(('header', width), lambda: sys.intern(header_style(
+            self.header_background_color, self.font_color, self.font_family,
+            self.font_size, self.color, self.text_align,
+            self.border_bottom, self.padding, width)))
+
+
+    def cell(self, tag, parity, width=None, font_color=None):
+        width = self.width if width is None else width
+        font_color = font_color or self.font_color
+        return self.__lookup__((tag, parity, width, font_color), lambda: sys.intern(cell_style(
+            tag, self.backgrounds[parity], font_color, self.font_family,
+            self.font_size, self.text_align, self.padding, width)))
+
+
+    def row_templates(self, index, widths, dynamic):
+        """`str.format` templates for odd and even rows.
+
+        Columns whose positions are in `dynamic` get a bare `{}` so the
+        caller can pass a per-cell prefix along with the text.
+        """
+        def build():
+            templates = []
+            for parity in (0, 1):
+                cells = []
+                if index:
+                    cells.append('      ' + _template_safe(
+                        self.cell('th', parity)) + '{}</th>\n')
+                for j, width in enumerate(widths):
+                    if j in dynamic:
+                        cells.append('      {}</td>\n')
+                    else:
+                        cells.append('      ' + _template_safe(
+                            self.cell('td', parity, width)) + '{}</td>\n')
+                templates.append('    <tr>\n' + ''.join(cells) + '    </tr>\n')
+            return tuple(templates)
+        return self.__lookup__(('rows', index, tuple(widths), frozenset(dynamic)), build)
+
+
+    def __repr__(self):
+        return f"Theme(hits={self.hits}, misses={self.misses}, prefixes={len(self.prefixes)})"
+
+
+@functools.lru_cache(maxsize=64)
+def get_theme(color, font_size, font_family, text_align, width, font_color,
+              even_bg_color, odd_bg_color, border_bottom_color, padding):
+    """Shared `Theme` per argument combination.
+    `get_theme.cache_info()` reports hits/misses, `get_theme.cache_clear()` resets.
+    """
+    return Theme(
+        color=color, font_size=font_size, font_family=font_family,
+        text_align=text_align, width=width, font_color=font_color,
+        even_bg_color=even_bg_color, odd_bg_color=odd_bg_color,
+        border_bottom_color=border_bottom_color, padding=padding)
+
+
+def _template_safe(prefix):
+    return prefix.replace('{', '{{').replace('}', '}}')
+
+
+def _column_widths(df, width, width_dict):
+    if not width_dict:
+        return [width] * df.shape[1]
+    assert len(width_dict) == df.shape[1], f"\
+    Expected one width per column ({df.shape[1]}), found {len(width_dict)}"
+    return list(width_dict)
+
+
+def _below(threshold):
+    return lambda col: pd.to_numeric(col, errors='coerce') < threshold
+
+
+def _above(threshold):
+    return lambda col: pd.to_numeric(col, errors='coerce') > threshold
+
+
+def compile_conditions(df, conditions):
+    """Turn `conditions` into `{column position: [(predicate, color), ...]}`.
+
+    Each entry of `conditions` maps a column name to a dict with any of:
+    - 'min'/'min_color': color numeric cells below 'min'
+    - 'max'/'max_color': color numeric cells above 'max'
+    - 'predicates': list of `(func, color)`, where `func(series)` returns a
+      boolean mask over the column's values
+    Rules are tried in that order and the first match sets the text color.
+    """
+    compiled = {}
+    for k, rule in conditions.items():
+        assert k in df.columns, f"\
+        Expected conditioned column `{k}` to be in DataFrame with columns:\n{df.columns}"
+        rules = []
+        if 'min' in rule: rules.append((_below(rule['min']), rule['min_color']))
+        if 'max' in rule: rules.append((_above(rule['max']), rule['max_color']))
+        rules.extend(rule.get('predicates', []))
+        compiled[list(df.columns).index(k)] = rules
+    return compiled
+
+
+def _condition_states(col, rules):
+    """Index of the first rule matching each cell, 0 where none do."""
+    states = np.zeros(len(col), dtype=np.int8)
+    for i in reversed(range(len(rules))):
+        mask = np.asarray(rules[i][0](col), dtype=bool)
+        states[mask] = i + 1
+    return states
+
+
+def render_thead(df, theme, index, escape, widths):
+    """`<table>` through `<tbody>`, with one styled `<th>` per header cell."""
+    thead = df.iloc[:0].to_html(na_rep="", index=index, border=0, escape=escape)
+    thead = thead[:thead.index('<tbody>') + len('<tbody>\n')]
+    prefixes = [theme.header(w) for w in widths]
+    if index:
+        prefixes.insert(0, theme.header())
+    pieces = thead.split('<th>')
+    assert len(pieces) == len(prefixes) + 1
+    return pieces[0] + ''.join(p + s for p, s in zip(prefixes, pieces[1:]))
+
+
+def iter_rows(df, theme, index, escape, float_format, widths, conditions={},
+              chunksize=None):
+    """Emit the `<tr>` rows of the table body, `chunksize` rows at a time.
+
+    Cells are formatted column by column, then every row is filled into one
+    of two row templates (one per row parity) that already carry the styled
+    `<th>`/`<td>` prefixes. Columns named in `conditions` carry their prefix
+    with each cell instead, picked by row parity and the first matching rule,
+    so styling costs one vectorized predicate per rule and chunk.
+    """
+    ncols = df.shape[1]
+    conditioned = {
+        j: (rules, [
+            [theme.cell('td', parity, widths[j])]
+            + [theme.cell('td', parity, widths[j], color) for _, color in rules]
+            for parity in (0, 1)])
+        for j, rules in compile_conditions(df, conditions).items()}
+    odd, even = theme.row_templates(index, widths, conditioned.keys())
+
+    chunksize = chunksize or len(df)
+    for start in range(0, len(df), chunksize):
+        chunk = df.iloc[start:start + chunksize]
+        columns = [_format_column(chunk.iloc[:, j], None, escape) for j in range(ncols)]
+        if start == 0 and float_format is not None:
+            # the row-wise renderer only passed `float_format` for the first row
+            for j, col in enumerate(columns):
+                col[0] = _format_column(chunk.iloc[:1, j], float_format, escape)[0]
+        parities = (np.arange(start, start + len(chunk)) & 1).tolist()
+        for j, (rules, prefixes) in conditioned.items():
+            states = _condition_states(chunk.iloc[:, j], rules).tolist()
+            columns[j] = [prefixes[p][s] + text
+                          for p, s, text in zip(parities, states, columns[j])]
+        if index:
+            columns.insert(0, _escape_cells([str(label) for label in chunk.index], escape))
+        yield ''.join([
+            (even if p else odd).format(*cells)
+            for p, cells in zip(parities, zip(*columns))])
+
+
+def _restyle_rowwise(body, df, width_dict, conditions):
+    """Line-by-line `conditions`/`width_dict` pass of the row-wise renderer.
+    Arguments are validated the same way as on the single-pass path.
+    """
+    compile_conditions(df, conditions)
+    if width_dict: _column_widths(df, None, width_dict)
+    if conditions:
+        for k in conditions.keys():
+            conditions[k]['index'] = list(df.columns).index(k)
+            width_body = ''
+            w = 0
+            for line in io.StringIO(body):
+                updated_body = False
+                if  w == conditions[k]['index']:
+                    try:
+                        value = int(repr(line).split('>')[1].split('<')[0])
+                        if 'min' in conditions[k] and value < conditions[k]['min']:
+                            if 'color: black' in repr(line):
+                                width_body = width_body + repr(line).replace("color: black", 'color: ' + conditions[k]['min_color'])[1:]
+                            elif 'color: white' in repr(line):
+                                width_body = width_body + repr(line).replace("color: white", 'color: ' + conditions[k]['min_color'])[1:]
+                            else:
+                                width_body = width_body + repr(line).replace('">', '; color: ' + conditions[k]['min_color'] + '">')[1:]
+                            updated_body = True
+                        elif 'max' in conditions[k] and value > conditions[k]['max']:
+                            if 'color: black' in repr(line):
+                                width_body = width_body + repr(line).replace("color: black", 'color: ' + conditions[k]['max_color'])[1:]
+                            elif 'color: white' in repr(line):
+                                width_body = width_body + repr(line).replace("color: white", 'color: ' + conditions[k]['max_color'])[1:]
+                            else:
+                                width_body = width_body + repr(line).replace('">', '; color: ' + conditions[k]['max_color'] + '">')[1:]
+                            updated_body = True
+                    except (ValueError, IndexError):
+                        # not a cell holding an integer
+                        pass
+                if not updated_body:
+                    width_body = width_body + repr(line)[1:]
+
+                if str(repr(line))[:10] == "'      <td" or str(repr(line))[:10] == "'      <th":
+                    if w == len(df.columns) -1:
+                        w = 0
+                    else:
+                        w += 1
+            body = width_body[:len(width_body)-1]
+
+    if len(width_dict) == len(df.columns):
+        width_body = ''
+        w = 0
+        if conditions:
+            for line in body.split(r"\n'"):
+                width_body = width_body + repr(line).replace("width: auto", 'width: ' + width_dict[w])[1:]
+                if str(repr(line))[:10] == "'      <td" or str(repr(line))[:10] == "'      <th" :
+                    if w == len(df.columns) -1:
+                        w = 0
+                    else:
+                        w += 1
+        else:
+            for line in io.StringIO(body):
+                line = line.replace("\n", "")
+                width_body = width_body + repr(line).replace("width: auto", 'width: ' + width_dict[w])[1:]
+                if str(repr(line))[:10] == "'      <td" or str(repr(line))[:10] == "'      <th" :
+                    if w == len(df.columns) -1:
+                        w = 0
+                    else:
+                        w += 1
+        return width_body[:len(width_body)-1].replace("'", "")
+    else:
+        return body.replace(r"\n'", "")
+
+def _get_table_rowwise(
         df,
         color,
         font_size='medium',
@@ -183,66 +593,101 @@ def get_table(
     </tr>
     <tr>""")
 
-    if conditions:
-        for k in conditions.keys():
-            try:
-                conditions[k]['index'] = list(df.columns).index(k)
-                width_body = ''
-                w = 0
-                for line in io.StringIO(body):
-                    updated_body = False
-                    if  w == conditions[k]['index']:
-                        try:
-                            if int(repr(line).split('>')[1].split('<')[0]) < conditions[k]['min']:
-                                if 'color: black' in repr(line):
-                                    width_body = width_body + repr(line).replace("color: black", 'color: ' + conditions[k]['min_color'])[1:]
-                                elif 'color: white' in repr(line):
-                                    width_body = width_body + repr(line).replace("color: white", 'color: ' + conditions[k]['min_color'])[1:]
-                                else:
-                                    width_body = width_body + repr(line).replace('">', '; color: ' + conditions[k]['min_color'] + '">')[1:]
-                                updated_body = True
-                            elif int(repr(line).split('>')[1].split('<')[0]) > conditions[k]['max']:
-                                if 'color: black' in repr(line):
-                                    width_body = width_body + repr(line).replace("color: black", 'color: ' + conditions[k]['max_color'])[1:]
-                                elif 'color: white' in repr(line):
-                                    width_body = width_body + repr(line).replace("color: white", 'color: ' + conditions[k]['max_color'])[1:]
-                                else:
-                                    width_body = width_body + repr(line).replace('">', '; color: ' + conditions[k]['max_color'] + '">')[1:]
-                                updated_body = True
-                        except:
-                            pass
-                    if not updated_body:
-                        width_body = width_body + repr(line)[1:]
-
-                    if str(repr(line))[:10] == "'      <td" or str(repr(line))[:10] == "'      <th":
-                        if w == len(df.columns) -1:
-                            w = 0
-                        else:
-                            w += 1
-                body = width_body[:len(width_body)-1]
-            except:
-                pass
+    return _restyle_rowwise(body=body, df=df, width_dict=width_dict, conditions=conditions)
 
-    if len(width_dict) == len(df.columns):
-        width_body = ''
-        w = 0
-        if conditions:
-            for line in body.split(r"\n'"):
-                width_body = width_body + repr(line).replace("width: auto", 'width: ' + width_dict[w])[1:]
-                if str(repr(line))[:10] == "'      <td" or str(repr(line))[:10] == "'      <th" :
-                    if w == len(df.columns) -1:
-                        w = 0
-                    else:
-                        w += 1
-        else:
-            for line in io.StringIO(body):
-                line = line.replace("\n", "")
-                width_body = width_body + repr(line).replace("width: auto", 'width: ' + width_dict[w])[1:]
-                if str(repr(line))[:10] == "'      <td" or str(repr(line))[:10] == "'      <th" :
-                    if w == len(df.columns) -1:
-                        w = 0
-                    else:
-                        w += 1
-        return width_body[:len(width_body)-1].replace("'", "")
-    else:
-        return body.replace(r"\n'", "")
\ No newline at end of file
+
+def get_table(
+        df,
+        color,
+        font_size='medium',
+        font_family='Century Gothic, sans-serif',
+        text_align='left',
+        width='auto',
+        index=False,
+        font_color='black',
+        even_bg_color='white',
+        odd_bg_color=None,
+        border_bottom_color=None,
+        escape=True,
+        width_dict=[],
+        padding="0px 20px 0px 0px",
+        float_format=None,
+        conditions={}):
+
+    if df.empty:
+      return ''
+
+    if not _can_render_fast(df, index):
+        return _get_table_rowwise(
+            df=df, color=color, font_size=font_size, font_family=font_family,
+            text_align=text_align, width=width, index=index, font_color=font_color,
+            even_bg_color=even_bg_color, odd_bg_color=odd_bg_color,
+            border_bottom_color=border_bottom_color, escape=escape,
+            width_dict=width_dict, padding=padding, float_format=float_format,
+            conditions=conditions)
+
+    return ''.join(iter_table(
+        df=df, color=color, font_size=font_size, font_family=font_family,
+        text_align=text_align, width=width, index=index, font_color=font_color,
+        even_bg_color=even_bg_color, odd_bg_color=odd_bg_color,
+        border_bottom_color=border_bottom_color, escape=escape,
+        width_dict=width_dict, padding=padding, float_format=float_format,
+        conditions=conditions, chunksize=None))
+
+
+def iter_table(
+        df,
+        color,
+        font_size='medium',
+        font_family='Century Gothic, sans-serif',
+        text_align='left',
+        width='auto',
+        index=False,
+        font_color='black',
+        even_bg_color='white',
+        odd_bg_color=None,
+        border_bottom_color=None,
+        escape=True,
+        width_dict=[],
+        padding="0px 20px 0px 0px",
+        float_format=None,
+        conditions={},
+        chunksize=1000):
+    """Streaming version of `get_table`.
+
+    Yields the header, then the body `chunksize` rows at a time, then the
+    closing tags, so only one chunk of HTML is held in memory at once
+    (`chunksize=None` renders the whole body as one chunk).
+    `conditions` (see `compile_conditions`) and `width_dict` (one width per
+    column) are applied as each cell is emitted.
+    """
+    if df.empty:
+        return
+
+    if not _can_render_fast(df, index):
+        yield get_table(
+            df=df, color=color, font_size=font_size, font_family=font_family,
+            text_align=text_align, width=width, index=index, font_color=font_color,
+            even_bg_color=even_bg_color, odd_bg_color=odd_bg_color,
+            border_bottom_color=border_bottom_color, escape=escape,
+            width_dict=width_dict, padding=padding, float_format=float_format,
+            conditions=conditions)
+        return
+
+    theme = get_theme(
+        color=color, font_size=font_size, font_family=font_family,
+        text_align=text_align, width=width, font_color=font_color,
+        even_bg_color=even_bg_color, odd_bg_color=odd_bg_color,
+        border_bottom_color=border_bottom_color, padding=padding)
+    widths = _column_widths(df, width, width_dict)
+    yield '<p>' + render_thead(df, theme, index, escape, widths)
+    yield from iter_rows(
+        df, theme, index, escape, float_format, widths,
+        conditions=conditions, chunksize=chunksize)
+    yield '  </tbody>\n</table></p>'
+
+
+def write_table(df, fh, **kwargs):
+    """Write `iter_table(df, **kwargs)` to the open text file `fh` chunk by chunk."""
+    for chunk in iter_table(df, **kwargs):
+        fh.write(chunk)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# vim: set ts=4 sts=0 sw=4 si fenc=utf-8 et:
+# vim: set fdm=marker fmr={{{,}}} fdl=0 foldcolumn=4:
+# Authors:     BP
+# Maintainers: BP
+# Copyright:   2025, HRDAG, GPL v2 or later
+# =========================================
+
+# ---- dependencies {{{
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import pyarrow as pa
+import pyarrow.feather as feather
+
+sys.path.append(str(Path(__file__).resolve().parent))
+import Summary
+import Relative_risk
+import Chi_square
+from result_cache import ResultCache, param_columns
+#}}}
+
+TEMPLATES = {
+    'Summary': Summary.Summary,
+    'Contingency': Relative_risk.Contingency,
+    'Ratio': Relative_risk.Ratio,
+    'Census': Chi_square.Census,
+    'Equal': Chi_square.Equal,
+}
+
+# what each kind of job contributes to the report unless the job lists its own getters
+PRESENT = {
+    'Summary': ['getinfo'],
+    'Contingency': ['gettable'],
+    'Ratio': ['getinfo'],
+    'Census': ['getinfo'],
+    'Equal': ['getinfo'],
+}
+
+# per-process state, filled once by `initworker` instead of shipping the DataFrame with every job:
+# the memory-mapped Arrow table, or the DataFrame itself when running in-process
+WORKER = {}
+
+# --- support methods --- {{{
+def verifyjob(job):
+    assert job['kind'] in TEMPLATES.keys(), f"\
+    Expected job kind to be one of {list(TEMPLATES.keys())}, found {job['kind']}"
+    assert 'params' in job.keys(), f"Expected job to have params, found {job.keys()}"
+    if job['kind'] not in ('Census', 'Equal'):
+        assert 'labels' in job.keys(), f"Expected {job['kind']} job to have labels, found {job.keys()}"
+    return 1
+
+
+def share_frame(df, path):
+    """Write `df` once as an uncompressed Arrow IPC file that workers memory-map."""
+    feather.write_feather(df, path, compression='uncompressed')
+    return path
+
+
+def load_table(path):
+    """The shared Arrow file as a table whose buffers point into the memory map."""
+    return pa.ipc.open_file(pa.memory_map(str(path), 'r')).read_all()
+
+
+def job_frame(kind, params):
+    """The columns one job reads (plus any stored index) as a DataFrame.
+
+    Only those columns are converted from the shared table, so a worker
+    never holds its own copy of the whole frame; numeric columns without
+    nulls can stay zero-copy views of the memory map.
+    """
+    if WORKER['df'] is not None: return WORKER['df']
+    table = WORKER['table']
+    metadata = table.schema.pandas_metadata or {}
+    index = [col for col in metadata.get('index_columns', []) if type(col) is str]
+    cols = param_columns(kind, params, table.column_names) + index
+    return table.select(cols).to_pandas(split_blocks=True)
+
+
+def initworker(path, cachedir):
+    WORKER['table'] = None if path is None else load_table(path)
+    WORKER['df'] = None
+    WORKER['cache'] = None if cachedir is None else ResultCache(cachedir=cachedir)
+
+
+def run_job(job):
+    """Build one template and return the paragraphs it presents, in order.
+    Getters with nothing to present (None) are skipped.
+    """
+    kind = job['kind']
+    if kind in ('Census', 'Equal'): template = TEMPLATES[kind](job['params'])
+    else: template = TEMPLATES[kind](job_frame(kind, job['params']), job['params'], job['labels'])
+    getters = job.get('present', PRESENT[kind])
+    if WORKER['cache'] is not None: WORKER['cache'].load(template, getters=getters)
+    paragraphs = []
+    for getter in getters:
+        out = getattr(template, getter)()
+        if type(out) is tuple: paragraphs += [str(item) for item in out if item is not None]
+        elif out is not None: paragraphs.append(str(out))
+    return paragraphs
+
+
+def build_report(df, jobs, workers=None, cachedir=None, chunksize=1):
+    """Run every job across a process pool and return their paragraphs in the declared order.
+
+    `df` is written once to an Arrow file that each worker memory-maps when
+    it starts, so no job pickles the DataFrame, and each job converts only
+    the columns it reads (see `job_frame`). With `workers=1` everything
+    runs in this process, which is easier to debug. `cachedir` turns on
+    the `ResultCache` in every worker.
+    """
+    for job in jobs: assert verifyjob(job)
+    if workers == 1:
+        initworker(None, cachedir)
+        WORKER['df'] = df
+        return [run_job(job) for job in jobs]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = None if df is None else share_frame(df, os.path.join(tmpdir, 'df.arrow'))
+        with ProcessPoolExecutor(
+                max_workers=workers, initializer=initworker, initargs=(path, cachedir)) as pool:
+            return list(pool.map(run_job, jobs, chunksize=chunksize))
+
+
+def write_report(mdFile, jobs, results, item_i=1):
+    """Add results to an `mdutils` file in job order, numbering jobs that have an `intro`,
+    the way `report_outcome` does.
+    """
+    for job, paragraphs in zip(jobs, results):
+        if 'intro' in job.keys():
+            mdFile.new_paragraph(f"{item_i}.\t{job['intro']}\n\n\t")
+            item_i += 1
+        for paragraph in paragraphs: mdFile.new_paragraph(paragraph)
+        mdFile.new_paragraph()
+    return item_i
+# }}}
+
+# done.
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+# vim: set ts=4 sts=0 sw=4 si fenc=utf-8 et:
+# vim: set fdm=marker fmr={{{,}}} fdl=0 foldcolumn=4:
+# Authors:     BP
+# Maintainers: BP
+# Copyright:   2025, HRDAG, GPL v2 or later
+# =========================================
+
+# ---- dependencies {{{
+import sys
+from pathlib import Path
+import pytest
+
+# the templates import each other as top-level modules
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from bench_templates import fake_cases, getlabels
+#}}}
+
+# --- fixtures --- {{{
+@pytest.fixture
+def cases():
+    return fake_cases(500, seed=0)
+
+
+@pytest.fixture
+def labels():
+    return getlabels()
+# }}}
+
+# done.
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+# vim: set ts=4 sts=0 sw=4 si fenc=utf-8 et:
+# vim: set fdm=marker fmr={{{,}}} fdl=0 foldcolumn=4:
+# Authors:     BP
+# Maintainers: BP
+# Copyright:   2025, HRDAG, GPL v2 or later
+# =========================================
+
+# ---- dependencies {{{
+import os
+import argparse
+import hashlib
+import pickle
+import tempfile
+import threading
+import weakref
+from pathlib import Path
+import numpy as np
+import pandas as pd
+#}}}
+
+CACHE_DIR = Path(__file__).resolve().parent / 'cache'
+MAX_BYTES = 512 * 2**20
+
+# column hashes already computed, {id(df): {col: (values, identity, digest)}}; a frame's
+# entry is dropped when the frame is garbage collected, see `column_fingerprint`
+FINGERPRINTS = {}
+FINGERPRINTS_LOCK = threading.Lock()
+
+# what each template stores; a Summary's artifacts are split by the getter
+# presenting them, so a cache entry only holds what was asked for
+ARTIFACTS = {'Contingency': ['table'], 'Ratio': ['magic', 'info', 'ci'], 'Census': ['info'], 'Equal': ['info']}
+SUMMARY_ARTIFACTS = {
+    'getmagic': ['magic'],
+    'getinfo': ['info'],
+    'gettable_wingroup': ['label', 'table_wingroup'],
+    'gettable_winevent': ['label', 'table_winevent'],
+}
+
+# --- support methods --- {{{
+def getargs():
+    parser = argparse.ArgumentParser(description="Inspect or clear the analysis result cache.")
+    parser.add_argument("action", choices=["info", "clear", "evict"])
+    parser.add_argument("--cachedir", default=CACHE_DIR)
+    parser.add_argument("--maxbytes", type=int, default=MAX_BYTES,
+                        help="size limit applied by `evict`")
+    args = parser.parse_args()
+    return args
+
+
+def column_identity(values):
+    """What backs `values` (a column or an index): the address, strides,
+    length and dtype of its numpy buffer, or its array object otherwise.
+    While `values` is referenced, copy-on-write gives an edited or
+    reassigned column new backing, so the identity only matches if the
+    contents are the same.
+    """
+    if isinstance(values, pd.Index): return id(values)
+    if isinstance(values.dtype, np.dtype):
+        data = values.to_numpy()
+        return (data.__array_interface__['data'][0], data.strides, len(data), str(data.dtype))
+    return id(values.array)
+
+
+def column_fingerprint(df, col):
+    """Full hash of `df[col]` (`pd.util.hash_pandas_object`, which is the
+    slow part of a cache lookup), remembered per frame and column along
+    with the column itself, and reused while `column_identity` says the
+    frame still holds that exact column. `col=None` hashes the index.
+    """
+    values = df.index if col is None else df[col]
+    identity = column_identity(values)
+    with FINGERPRINTS_LOCK:
+        known = FINGERPRINTS.get(id(df), {}).get(col)
+    if (known is not None) and (known[1] == identity): return known[2]
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{col}|{values.dtype}".encode())
+    digest.update(pd.util.hash_pandas_object(values, index=False).to_numpy().tobytes())
+    digest = digest.hexdigest()
+    with FINGERPRINTS_LOCK:
+        if id(df) not in FINGERPRINTS:
+            FINGERPRINTS[id(df)] = {}
+            weakref.finalize(df, forget_fingerprints, id(df))
+        FINGERPRINTS[id(df)][col] = (values, identity, digest)
+    return digest
+
+
+def forget_fingerprints(df):
+    """Drop remembered column hashes for `df` (or its id), releasing the columns they hold."""
+    with FINGERPRINTS_LOCK:
+        FINGERPRINTS.pop(df if type(df) is int else id(df), None)
+    return 1
+
+
+def fingerprint(df, cols):
+    """Fast content hash of `cols` in `df`: one vectorized row hash per column
+    (`pd.util.hash_pandas_object`, index included) folded into a blake2b digest
+    with the column names and dtypes. Column hashes are remembered while `df`
+    lives (see `column_fingerprint`), so repeated lookups skip rehashing.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(column_fingerprint(df, None).encode())
+    for col in sorted(set(cols)):
+        digest.update(column_fingerprint(df, col).encode())
+    return digest.hexdigest()
+
+
+def param_columns(kind, params, columns):
+    """The columns among `columns` that a template of `kind` with `params` reads."""
+    cols = [v for param, v in params.items() if ('_COL' in param) & (type(v) is str)]
+    if kind == 'Summary': cols += [col.replace('_wconv', '') for col in cols]
+    if (kind == 'Contingency') & ('COMPARISON_GROUP_COL' not in params.keys()): cols.append('race_ethnicity')
+    return [col for col in dict.fromkeys(cols) if col in columns]
+
+
+def relevant_columns(template):
+    """The DataFrame columns a template reads, so unrelated columns don't bust its key."""
+    return param_columns(type(template).__name__, template.params, template.df.columns)
+
+
+def cachekey(template):
+    """Key for a Summary/Contingency/Ratio/Census/Equal: its class, the
+    fingerprint of the columns it reads (if it reads a DataFrame) and its
+    params and labels.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(type(template).__name__.encode())
+    if hasattr(template, 'df'):
+        digest.update(fingerprint(template.df, relevant_columns(template)).encode())
+    digest.update(repr(template.params).encode())
+    digest.update(repr(getattr(template, 'labels', None)).encode())
+    return digest.hexdigest()
+
+
+def artifactkeys(kind, getters=None):
+    """Names of the artifacts behind `getters` (all of them without `getters`).
+    Only Summary artifacts are split up, the other templates' are cheap
+    and computed together.
+    """
+    if kind in ARTIFACTS.keys(): return ARTIFACTS[kind]
+    if kind != 'Summary': raise TypeError(f"Expected a Summary, Contingency, Ratio, Census or Equal, found {kind}")
+    if getters is None: getters = SUMMARY_ARTIFACTS.keys()
+    return list(dict.fromkeys(key for getter in getters for key in SUMMARY_ARTIFACTS.get(getter, [])))
+
+
+def getartifacts(template, keys=None):
+    """Compute (if needed) and collect what a template presents, for a
+    Summary only the artifacts named in `keys` (see `artifactkeys`).
+    """
+    kind = type(template).__name__
+    if kind == 'Summary':
+        if keys is None: keys = artifactkeys(kind)
+        return {key: getattr(template, key) for key in keys}
+    if kind == 'Contingency': return {'table': template.gettable()}
+    if kind == 'Ratio':
+        info = template.getinfo()
+        return {'magic': template.magic, 'info': info, 'ci': template.ci}
+    if kind in ('Census', 'Equal'): return {'info': template.getinfo()}
+    raise TypeError(f"Expected a Summary, Contingency, Ratio, Census or Equal, found {kind}")
+
+
+def setartifacts(template, artifacts):
+    """Put stored artifacts back so the template's getters skip computing."""
+    if type(template).__name__ == 'Summary': template.preset(**artifacts)
+    else:
+        for key, value in artifacts.items(): setattr(template, key, value)
+    return template
+
+
+class ResultCache():
+    """
+    On-disk, content-addressed cache of template artifacts (magic dicts,
+    info text, HTML tables). Entries are pickles named by `cachekey`;
+    a hit refreshes the entry's mtime, and once the directory grows past
+    `maxbytes` the least recently used entries are removed.
+    """
+
+    def __init__(self, cachedir=CACHE_DIR, maxbytes=MAX_BYTES):
+        self.cachedir = Path(cachedir)
+        self.maxbytes = maxbytes
+        self.hits, self.misses = 0, 0
+
+
+    def __path__(self, key):
+        return self.cachedir / f"{key}.pkl"
+
+
+    def get(self, key):
+        path = self.__path__(key)
+        try:
+            with open(path, 'rb') as f: value = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+        os.utime(path)
+        self.hits += 1
+        return value
+
+
+    def put(self, key, value):
+        """Write atomically, so a concurrent reader never sees half an entry."""
+        self.cachedir.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.cachedir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f: pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.__path__(key))
+        self.evict()
+        return key
+
+
+    def entries(self):
+        """One row per entry, most recently used first."""
+        rows = []
+        if self.cachedir.exists():
+            for path in self.cachedir.glob('*.pkl'):
+                stat = path.stat()
+                rows.append({'key': path.stem, 'bytes': stat.st_size,
+                             'last_used': pd.Timestamp(stat.st_mtime, unit='s')})
+        entries = pd.DataFrame(rows, columns=['key', 'bytes', 'last_used'])
+        return entries.sort_values('last_used', ascending=False, ignore_index=True)
+
+
+    def evict(self, maxbytes=None):
+        """Drop least recently used entries until the cache fits in `maxbytes`."""
+        if maxbytes is None: maxbytes = self.maxbytes
+        entries = self.entries()
+        over = entries.loc[entries['bytes'].cumsum() > maxbytes]
+        for key in over['key']: self.__path__(key).unlink(missing_ok=True)
+        return over.shape[0]
+
+
+    def clear(self):
+        entries = self.entries()
+        for key in entries['key']: self.__path__(key).unlink(missing_ok=True)
+        return entries.shape[0]
+
+
+    def load(self, template, getters=None):
+        """Fill `template` from the cache with what `getters` present, computing
+        and storing any artifacts the entry doesn't have yet.
+        """
+        key = cachekey(template)
+        artifacts = self.get(key)
+        if artifacts is None: artifacts = {}
+        else: setartifacts(template, artifacts)
+        missing = [name for name in artifactkeys(type(template).__name__, getters)
+                   if name not in artifacts.keys()]
+        if missing:
+            artifacts = {**artifacts, **getartifacts(template, missing)}
+            self.put(key, artifacts)
+        return setartifacts(template, artifacts)
+
+
+    def __repr__(self):
+        entries = self.entries()
+        return f"ResultCache({self.cachedir}, {entries.shape[0]} entries, {entries['bytes'].sum():,} of {self.maxbytes:,} bytes)"
+# }}}
+
+# --- main --- {{{
+if __name__ == '__main__':
+    args = getargs()
+    cache = ResultCache(cachedir=args.cachedir, maxbytes=args.maxbytes)
+    if args.action == 'info':
+        print(cache)
+        print(cache.entries().to_string(index=False))
+    elif args.action == 'clear': print(f"removed {cache.clear()} entries from {cache.cachedir}")
+    else: print(f"evicted {cache.evict()} entries from {cache.cachedir}")
+# }}}
+
+# done.
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+# vim: set ts=4 sts=0 sw=4 si fenc=utf-8 et:
+# vim: set fdm=marker fmr={{{,}}} fdl=0 foldcolumn=4:
+# Authors:     BP
+# Maintainers: BP
+# Copyright:   2025, HRDAG, GPL v2 or later
+# =========================================
+
+# ---- dependencies {{{
+import numpy as np
+import pandas as pd
+import pytest
+import Chi_square
+#}}}
+
+# --- tests --- {{{
+@pytest.mark.parametrize('mode', ['asymptotic', 'auto', 'exact', 'montecarlo'])
+def test_batch_mode_is_the_method_used(mode):
+    obstable = {'a': [0, 3, 40], 'b': [0, 1, 60], 'c': [0, 2, 50]}
+    table = Chi_square.add_chisquare_batch(
+        obstable, None, null_phrase='x', sig=.05, ddof=0, options={'MODE': mode, 'REPS': 500})
+    assert pd.isna(table['mode'].iloc[0])
+    assert table['reason'].iloc[0] == 'no observations'
+    assert np.isnan(table['pvalue'].iloc[0])
+    used = table['mode'].iloc[1:].tolist()
+    if mode == 'auto': assert used == ['exact', 'asymptotic']
+    else: assert used == [mode, mode]
+# }}}
+
+# done.
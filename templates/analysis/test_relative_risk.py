@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# vim: set ts=4 sts=0 sw=4 si fenc=utf-8 et:
+# vim: set fdm=marker fmr={{{,}}} fdl=0 foldcolumn=4:
+# Authors:     BP
+# Maintainers: BP
+# Copyright:   2025, HRDAG, GPL v2 or later
+# =========================================
+
+# ---- dependencies {{{
+import numpy as np
+import pytest
+import Relative_risk
+from bench_templates import GROUPS
+#}}}
+
+MATRIX_PARAMS = {
+    'GROUP_COLS': [f'is_{group}' for group in GROUPS], 'OUTCOME_EVENT_OP': 'were',
+    'OUTCOME_EVENT_COL': 'convicted', 'GIVEN_EVENT_COL': 'filed',
+    'CI_METHOD': 'bootstrap', 'CI_REPS': 400, 'CI_BATCH': 100}
+
+# --- tests --- {{{
+@pytest.mark.parametrize('counts', [(0, 50, 10, 40), (10, 40, 0, 50)])
+def test_zero_events_have_no_interval(counts):
+    analytic = Relative_risk.relrisk_ci_analytic(*counts, level=.95)
+    bootstrap = Relative_risk.relrisk_ci_bootstrap(
+        *counts, level=.95, reps=2000, batch=1000, workers=None, seed=0)
+    assert np.isnan(analytic).all() & np.isnan(bootstrap).all()
+
+
+def test_matrix_bootstraps_share_one_pool(cases, labels, monkeypatch):
+    inprocess = Relative_risk.RatioMatrix(cases, MATRIX_PARAMS, labels).gettable()
+    started = []
+    class Pool(Relative_risk.ProcessPoolExecutor):
+        def __init__(self, *args, **kwargs):
+            started.append(kwargs)
+            super().__init__(*args, **kwargs)
+    monkeypatch.setattr(Relative_risk, 'ProcessPoolExecutor', Pool)
+    matrix = Relative_risk.RatioMatrix(cases, {**MATRIX_PARAMS, 'CI_WORKERS': 2}, labels)
+    pooled = matrix.gettable()
+    assert len(started) == 1
+    assert pooled[['CI_LOWER', 'CI_UPPER']].equals(inprocess[['CI_LOWER', 'CI_UPPER']])
+    assert all(ratio.pool is None for ratio in matrix.ratios.values())
+# }}}
+
+# done.
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# vim: set ts=4 sts=0 sw=4 si fenc=utf-8 et:
+# vim: set fdm=marker fmr={{{,}}} fdl=0 foldcolumn=4:
+# Authors:     BP
+# Maintainers: BP
+# Copyright:   2025, HRDAG, GPL v2 or later
+# =========================================
+
+# ---- dependencies {{{
+import Summary
+import result_cache
+from bench_templates import fake_cases
+from build_report import build_report
+from result_cache import ResultCache, fingerprint
+#}}}
+
+PARAMS = {'INDICATOR_COL': 'filed', 'INDICATOR_OP': 'were', 'GROUP_COL': 'race_ethnicity'}
+
+# --- tests --- {{{
+def test_load_stores_only_presented_artifacts(cases, labels, tmp_path):
+    # the default RENAMER has no GROUP_COL entry, so `table_winevent` can't be built
+    cache = ResultCache(cachedir=tmp_path)
+    summary = cache.load(Summary.Summary(cases, dict(PARAMS), labels), getters=['getinfo'])
+    assert summary.getinfo() == Summary.Summary(cases, dict(PARAMS), labels).getinfo()
+    assert list(cache.get(cache.entries().key[0]).keys()) == ['info']
+
+
+def test_load_adds_missing_artifacts(cases, labels, tmp_path):
+    cache = ResultCache(cachedir=tmp_path)
+    cache.load(Summary.Summary(cases, dict(PARAMS), labels), getters=['getinfo'])
+    summary = cache.load(Summary.Summary(cases, dict(PARAMS), labels), getters=['getinfo', 'gettable_wingroup'])
+    assert 'info' not in summary.cachestats().keys()
+    assert sorted(cache.get(cache.entries().key[0]).keys()) == ['info', 'label', 'table_wingroup']
+
+
+def test_build_report_with_cache(cases, labels, tmp_path):
+    jobs = [{'kind': 'Summary', 'params': dict(PARAMS), 'labels': labels}]
+    assert build_report(cases, jobs, workers=1, cachedir=tmp_path) == build_report(cases, jobs, workers=1)
+
+
+def test_warm_load_computes_nothing(cases, labels, tmp_path):
+    params = {'INDICATOR_COL': 'filed_wconv', 'INDICATOR_OP': 'were', 'GROUP_COL': 'race_ethnicity'}
+    getters = ['getinfo', 'gettable_wingroup', 'gettable_winevent']
+    present = lambda summary: [getattr(summary, getter)() for getter in getters]
+    cache = ResultCache(cachedir=tmp_path)
+    computed = present(cache.load(Summary.Summary(cases, dict(params), labels), getters=getters))
+    summary = cache.load(Summary.Summary(cases, dict(params), labels), getters=getters)
+    assert present(summary) == computed
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert all(stats['misses'] == 0 for stats in summary.cachestats().values())
+
+
+def test_fingerprint_sees_every_row():
+    # more rows than any sample, changing a single one
+    cases = fake_cases(5000, seed=1)
+    before = fingerprint(cases, ['filed'])
+    assert fingerprint(cases, ['filed']) == before
+    changed = cases['filed'].copy()
+    changed.iloc[4001] = not changed.iloc[4001]
+    cases['filed'] = changed
+    assert fingerprint(cases, ['filed']) != before
+    cases.loc[4001, 'filed'] = not cases.loc[4001, 'filed']
+    assert fingerprint(cases, ['filed']) == before
+
+
+def test_fingerprint_sees_edits_in_place(cases):
+    before = {col: fingerprint(cases, [col]) for col in ('race_ethnicity', 'convicted')}
+    cases.loc[7, 'race_ethnicity'] = 'edited'
+    cases.iloc[7, cases.columns.get_loc('convicted')] = not cases['convicted'].iloc[7]
+    assert all(fingerprint(cases, [col]) != digest for col, digest in before.items())
+
+
+def test_fingerprint_reuses_column_hashes(cases, monkeypatch):
+    fingerprint(cases, ['filed', 'race_ethnicity'])
+    monkeypatch.setattr(result_cache.pd.util, 'hash_pandas_object', None)
+    fingerprint(cases, ['filed', 'race_ethnicity'])
+
+
+def test_cached_summary_follows_data(cases, labels, tmp_path):
+    cache = ResultCache(cachedir=tmp_path)
+    cache.load(Summary.Summary(cases, dict(PARAMS), labels), getters=['getinfo'])
+    cases.loc[cases.index[-1], 'filed'] = not cases['filed'].iloc[-1]
+    summary = cache.load(Summary.Summary(cases, dict(PARAMS), labels), getters=['getinfo'])
+    assert summary.getinfo() == Summary.Summary(cases, dict(PARAMS), labels).getinfo()
+    assert cache.hits == 0
+# }}}
+
+# done.